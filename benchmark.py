@@ -0,0 +1,240 @@
+# Benchmark suite with fixed seeds and JSON output, run `python benchmark.py --help` for its options.
+
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from src.engine import Engine, generate_level
+from src.entities.entity_factory import player, zombie
+from src.utilities.pathfind import get_path_to
+from src.world.tile import floor
+from environment.environment import RLEnv
+
+def summarise(times: List[float]) -> Dict[str, float]:
+    """
+    Summarises the times of many calls in microseconds.
+
+    Args:
+        times (List[float]): Time of every call in seconds.
+
+    Returns:
+        Dict[str, float]: Number of calls, and the mean, median and fastest call in microseconds.
+    """
+    times = np.array(times) * 1e6
+    return {
+        "calls": len(times),
+        "mean_us": float(times.mean()),
+        "median_us": float(np.median(times)),
+        "min_us": float(times.min())
+    }
+
+def time_calls(function: Callable[[], object], repeats: int) -> Dict[str, float]:
+    """
+    Times a function called again and again without arguments.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return summarise(times)
+
+def bench_level_generation(seed: int, repeats: int, max_depth: int = 6) -> List[dict]:
+    """
+    Times generating a level at every depth, over as many seeds as repeats.
+    """
+    results = []
+    for depth in range(max_depth):
+        players = [copy.deepcopy(player) for _ in range(repeats)]
+        times = []
+        for level_idx in range(repeats):
+            start = time.perf_counter()
+            generate_level(depth, players[level_idx], seed + level_idx)
+            times.append(time.perf_counter() - start)
+        results.append({"name": "level_generation", "params": {"depth": depth}, **summarise(times)})
+    return results
+
+def make_engine(seed: int, num_enemies: int) -> Engine:
+    """
+    Makes a game with a set number of zombies placed on free floor tiles, the whole map explored so that every
+    enemy moves, and a player that can't die.
+    """
+    engine = Engine(copy.deepcopy(player), seed, True)
+    level = engine.level
+    for enemy in list(level.enemies.values()):
+        level.remove(enemy.pos)
+
+    rng = random.Random(seed)
+    free = [tuple(pos) for pos in np.argwhere(level.glyphs == floor.code).tolist()]
+    for pos in rng.sample(free, min(num_enemies, len(free))):
+        level.place(copy.copy(zombie), pos)
+
+    level.explored[:] = True
+    engine.player.hp = engine.player.max_hp = 10**9
+    return engine
+
+def bench_enemy_turns(seed: int, repeats: int, enemy_counts: Tuple[int, ...] = (2, 4, 8, 16, 32)) -> List[dict]:
+    """
+    Times Engine.handle_enemy_turns with different numbers of enemies, putting the game back into the same state before every turn.
+    """
+    results = []
+    for num_enemies in enemy_counts:
+        engine = make_engine(seed, num_enemies)
+        state = engine.snapshot()
+        times = []
+        for _ in range(repeats):
+            engine.restore(state)
+            start = time.perf_counter()
+            engine.handle_enemy_turns()
+            times.append(time.perf_counter() - start)
+        results.append({"name": "enemy_turns", "params": {"enemies": len(engine.level.enemies)}, **summarise(times)})
+    return results
+
+def bench_path_to(seed: int, repeats: int) -> List[dict]:
+    """
+    Times get_path_to from an enemy to the player, with the pathfinding grid already built and with it rebuilt for every call.
+    """
+    engine = make_engine(seed, 8)
+    level = engine.level
+    enemies = list(level.enemies.values())
+
+    def warm():
+        for enemy in enemies:
+            get_path_to(enemy, engine.player.pos, level)
+
+    def cold():
+        for enemy in enemies:
+            level.version += 1
+            get_path_to(enemy, engine.player.pos, level)
+
+    results = []
+    for name, function in (("warm", warm), ("cold", cold)):
+        summary = time_calls(function, repeats)
+        for key in ("mean_us", "median_us", "min_us"):
+            summary[key] /= len(enemies)
+        summary["calls"] *= len(enemies)
+        results.append({"name": "path_to", "params": {"grid": name}, **summary})
+    return results
+
+def bench_env(seed: int, repeats: int) -> List[dict]:
+    """
+    Times RLEnv.step and RLEnv.reset with numbers, image and planes observations, and with perfect and imperfect information.
+    """
+    results = []
+    for observation in ("numbers", "image", "planes"):
+        for perfect_info in (True, False):
+            params = {"observation": observation, "perfect_info": perfect_info}
+            env = RLEnv(seed=seed, to_image=observation == "image", fixed_seed=True, perfect_info=perfect_info, planar=observation == "planes")
+            env.reset()
+
+            rng = random.Random(seed)
+            times = []
+            for _ in range(repeats):
+                action = rng.randrange(4)
+                start = time.perf_counter()
+                env.step(action)
+                times.append(time.perf_counter() - start)
+                if env.done:
+                    env.reset()
+            results.append({"name": "env_step", "params": params, **summarise(times)})
+            results.append({"name": "env_reset", "params": params, **time_calls(env.reset, max(1, repeats // 10))})
+    return results
+
+def bench_training(seed: int, timesteps: int) -> List[dict]:
+    """
+    Measures end to end training steps per second with Stable Baselines, for every algorithm and policy that main.py offers.
+    Mlp policies learn from the numbers observation and Cnn policies from the image observation. DQN's replay buffer
+    is kept small and starts learning early, so that it trains within the timesteps given. Algorithms that collect
+    rollouts of a fixed length may step past the timesteps given, so the steps they really took are reported.
+    """
+    from stable_baselines3 import PPO, A2C, DQN
+    from stable_baselines3.common.utils import set_random_seed
+    from stable_baselines3.common.vec_env import DummyVecEnv
+
+    results = []
+    for algo in (DQN, PPO, A2C):
+        for policy in ("MlpPolicy", "CnnPolicy"):
+            env = DummyVecEnv([lambda: RLEnv(seed=seed, to_image=policy == "CnnPolicy", fixed_seed=True)])
+            kwargs = {"buffer_size": 10000 if policy == "MlpPolicy" else 1000, "learning_starts": 100} if algo is DQN else {}
+            set_random_seed(seed)
+            model = algo(policy, env, verbose=0, **kwargs)
+
+            start = time.perf_counter()
+            model.learn(total_timesteps=timesteps)
+            elapsed = time.perf_counter() - start
+
+            results.append({
+                "name": "training",
+                "params": {"algorithm": algo.__name__, "policy": policy},
+                "timesteps": model.num_timesteps,
+                "seconds": elapsed,
+                "steps_per_second": model.num_timesteps / elapsed
+            })
+            env.close()
+    return results
+
+def get_commit() -> str:
+    """
+    Gets the commit being benchmarked, if the code is in a git repository.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the engine, environment and training throughput.")
+    parser.add_argument("--seed", type=int, default=12345, help="Seed every benchmark starts from.")
+    parser.add_argument("--repeats", type=int, default=200, help="Calls timed for each engine and environment benchmark.")
+    parser.add_argument("--timesteps", type=int, default=2048, help="Timesteps to train for in each training benchmark.")
+    parser.add_argument("--groups", nargs="+", default=["levels", "enemies", "paths", "env", "training"],
+                        choices=["levels", "enemies", "paths", "env", "training"], help="Benchmarks to run.")
+    parser.add_argument("--output", default="", help="File to write the JSON results to, printed when left out.")
+    args = parser.parse_args()
+
+    groups = {
+        "levels": lambda: bench_level_generation(args.seed, args.repeats),
+        "enemies": lambda: bench_enemy_turns(args.seed, args.repeats),
+        "paths": lambda: bench_path_to(args.seed, args.repeats),
+        "env": lambda: bench_env(args.seed, args.repeats),
+        "training": lambda: bench_training(args.seed, args.timesteps)
+    }
+
+    results = []
+    for group in args.groups:
+        print(f"Running {group} benchmarks...")
+        results.extend(groups[group]())
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "commit": get_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeats": args.repeats,
+            "timesteps": args.timesteps
+        },
+        "results": results
+    }
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=4)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(report, indent=4))
+
+if __name__ == '__main__':
+    main()
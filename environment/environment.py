@@ -1,5 +1,7 @@
 # Gym Environment
 
+from __future__ import annotations
+
 from gym.spaces import Discrete
 from gym.spaces.box import Box
 from gym import Env
@@ -7,9 +9,10 @@ from gym import Env
 from stable_baselines3.common.evaluation import evaluate_policy
 
 from datetime import datetime
-from typing import List, Tuple
+from typing import List, Optional, Tuple, TYPE_CHECKING
 
 import time
+import os
 
 import random
 from math import ceil
@@ -18,12 +21,20 @@ import copy
 import multiprocessing as mp
 from multiprocessing import Pool
 
-from src.engine import Engine
+from src.engine import Engine, EngineState, ProfiledEngine
 from src.utilities.actions import Take, Attack
 from src.entities.entity_factory import player
 from src.utilities.pathfind import get_path_to
+from src.world.tile import glyphs, glyph_codes
+from src.world.level_pool import LevelPool
+from src.utilities.profiler import Profiler
+
+from environment.renderer import GlyphRenderer
 
-from PIL import Image, ImageDraw, ImageFont
+from PIL import ImageFont
+
+if TYPE_CHECKING:
+    from environment.recorder import Episode, TrajectoryRecorder
 
 # Translates discrete action to up, down, left, and right.
 action_translator = {
@@ -43,53 +54,268 @@ level_translator = {
     "z": -2,
     "v": -3,
     "q": -1,
+    "-": 2,
     " ": -4
 }
 
+# Spare slots after the stacked frames, so frames are written one after another and moved back to the start only once they run out.
+frame_slack = 64
+
+# Lookup tables indexed by the level's glyph codes, for the agent's numbers and for the logged map.
+number_table = np.array([level_translator[char] for char in glyphs], dtype=np.int8)
+glyph_bytes = np.frombuffer(glyphs.encode(), dtype=np.uint8)
+
+# Planes of the planar observation, one for each class of glyph, followed by the hp, depth and gold planes.
+plane_glyphs = ("#", ".-", "@", "z", "v", "+", ">", "q", " ")
+stat_planes = 3
+
+# One hot table indexed by [plane, glyph code], 1 where the glyph belongs to the plane.
+plane_table = np.array([[1 if char in chars else 0 for char in glyphs] for chars in plane_glyphs], dtype=np.uint8)
+
+def grid_string(grid: np.ndarray) -> str:
+    """
+    Builds a map for logs from glyph codes indexed by [y, x], with two spaces after every character.
+    """
+    height, width = grid.shape
+    chars = np.full((height, width*3 + 1), ord(" "), dtype=np.uint8)
+    chars[:, 0:width*3:3] = glyph_bytes[grid]
+    chars[:, -1] = ord("\n")
+    return chars.tobytes().decode() + "\n\n"
+
+# Text of every int8 followed by two spaces, padded with zero bytes and indexed by the int8's bits as a uint8.
+number_bytes = np.zeros((256, 6), dtype=np.uint8)
+for value in range(-128, 128):
+    text = f"{value}  ".encode()
+    number_bytes[value % 256, :len(text)] = np.frombuffer(text, dtype=np.uint8)
+
+def number_string(grid: np.ndarray) -> str:
+    """
+    Builds the agent's numbers view for logs from an int8 grid indexed by [y, x], with two spaces after every number.
+    """
+    height, width = grid.shape
+    chars = np.zeros((height, width*6 + 1), dtype=np.uint8)
+    chars[:, :-1] = number_bytes[np.ascontiguousarray(grid).view(np.uint8)].reshape(height, width*6)
+    chars[:, -1] = ord("\n")
+    chars = chars.ravel()
+    return chars[chars != 0].tobytes().decode() + "\n\n"
+
 class RLEnv(Env):
     
-    monospace = ImageFont.truetype("freemono.ttf",16)
+    monospace = ImageFont.truetype(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "FreeMono.ttf"), 16)
     
-    def __init__(self, seed: int = 0, to_image: bool = False, fixed_seed: bool = False, perfect_info: bool = True, map_size: Tuple[int, int] = (15, 18)) -> None:
+    def __init__(self, seed: int = 0, to_image: bool = False, fixed_seed: bool = False, perfect_info: bool = True, planar: bool = False, map_size: Tuple[int, int] = (15, 18), level_pool: Optional[LevelPool] = None, fov_radius: int = 3, shadowcasting: bool = False, profiler: Optional[Profiler] = None, recorder: Optional[TrajectoryRecorder] = None, verbosity: int = 0, frame_stack: int = 1, delta: bool = False) -> None:
         """
         RogueLike Reinforcement Learning Environment.
 
         Args:
             seed (int, optional): Seed if desired. Defaults to 0.
             fixed_seed (bool, optional): Write as true if you want to run with seed. Defaults to False.
+            planar (bool, optional): Whether the agent sees the map as planes of shape (channels, height, width), one plane for
+                each class of glyph, 1 where a tile belongs to it, and one for each of hp, depth and gold, instead of numbers.
+                Ignored for images. Defaults to False.
+            map_size (Tuple[int, int], optional): Height and width of every level. Defaults to (15, 18).
+            level_pool (Optional[LevelPool], optional): Pool to take pre-generated levels from, can be shared between environments. Defaults to None.
+            fov_radius (int, optional): Number of tiles the agent sees in every direction. Defaults to 3.
+            shadowcasting (bool, optional): Whether walls hide the tiles behind them from the agent. Defaults to False.
+            profiler (Optional[Profiler], optional): Profiler to record the time of each phase of a step in. Defaults to not timing anything.
+            recorder (Optional[TrajectoryRecorder], optional): Recorder to write every episode's levels, actions and rewards to. Defaults to not recording.
+            verbosity (int, optional): Detail of the info dictionary, 0 for counters only and 1 to add the map and the agent's view as text. Defaults to 0.
+            frame_stack (int, optional): Number of the last observations given to the agent at once, oldest first and joined
+                along their first axis. Not for images. Defaults to 1.
+            delta (bool, optional): Whether the agent is given the change of every cell since the last step instead of the
+                observation, zero where nothing changed, as int16. Not for images. Defaults to False.
         """
         # Necessary for game functionality:
         self.player = copy.deepcopy(player)
         self.fixed_seed = fixed_seed
         self.seed_num = seed
         self.perfect_info = perfect_info
-        self.engine = Engine(self.player, self.seed_num, self.fixed_seed)
+        self.map_size = map_size
+        self.level_pool = level_pool
+        self.fov_radius = fov_radius
+        self.shadowcasting = shadowcasting
+        self.profiler = profiler
+        self.recorder = recorder
+        self.verbosity = verbosity
+        self.episode: Optional[Episode] = None
+        self.engine = self.new_engine()
+        self.start_recording()
         
         # Necessary for environment functionality:
         self.to_image = to_image
+        self.planar = planar and not to_image
         self.action_space = Discrete(4)
         
         if to_image:
-            self.observation_space = Box(low=0, high=255, shape=(280,180,3), dtype=np.uint8) 
-            self.agent_view = np.array([[[0]*3]*(280)]*(180))
+            self.renderer = GlyphRenderer(self.monospace, self.engine.level.height, self.engine.level.width, shape=(280,180))
+            self.screen = np.zeros((self.engine.level.height, self.engine.level.width), dtype=np.uint8)
+            self.observation_space = Box(low=0, high=255, shape=self.renderer.frame.shape, dtype=np.uint8) 
+            self.agent_view = self.renderer.frame
+        elif self.planar:
+            self.screen = np.zeros((self.engine.level.height, self.engine.level.width), dtype=np.uint8)
+            # Glyph planes only go up to 1, so Stable Baselines doesn't take the planes for an image, which it would
+            # transpose whenever there are more planes than rows or columns, like for small levels or stacked frames.
+            high = np.full((len(plane_glyphs) + stat_planes, self.engine.level.height, self.engine.level.width), 255, dtype=np.uint8)
+            high[:len(plane_glyphs)] = 1
+            self.observation_space = Box(low=np.zeros_like(high), high=high, dtype=np.uint8)
+            self.agent_view = np.zeros(self.observation_space.shape, dtype=np.uint8)
         else:
             if perfect_info:
-                self.observation_space = Box(low=-3, high=4, shape=((self.engine.level.height+1),self.engine.level.width), dtype=np.int_) 
-                self.agent_view = np.array([[0]*(self.engine.level.width)]*(self.engine.level.height+1))
+                self.observation_space = Box(low=-3, high=4, shape=((self.engine.level.height+1),self.engine.level.width), dtype=np.int8) 
             else:
-                self.observation_space = Box(low=-4, high=4, shape=((self.engine.level.height+1),self.engine.level.width), dtype=np.int_) 
-                self.agent_view = np.array([[0]*(self.engine.level.width)]*(self.engine.level.height+1))
+                self.observation_space = Box(low=-4, high=4, shape=((self.engine.level.height+1),self.engine.level.width), dtype=np.int8) 
+            self.agent_view = np.zeros(((self.engine.level.height+1), self.engine.level.width), dtype=np.int8)
+        
+        # Necessary for frame stacking and delta mode:
+        self.frame_stack = frame_stack
+        self.delta = delta
+        if frame_stack > 1 or delta:
+            if to_image:
+                raise ValueError("Frame stacking and delta mode need the numbers or planar observation, not images")
+            self.start_frames()
                 
         # Necessary for reward calculation:
+        self.done = False
         self.time_spent = 0
         self.path_reward = 0
         self.last_hp = copy.deepcopy(self.engine.player.hp)
-        self.explored_reward = 0
         
         # Necessary for formal logs:
         self.exits_taken = 0
         self.enemies_killed = 0
         self.potions_taken = 0
+        
+        if self.profiler is not None:
+            self.instrument()
+
+    def start_frames(self) -> None:
+        """
+        Allocates the buffers of frame stacking and delta mode once, and changes the observation space to match.
+        Frames are written one after another into a buffer with frame_slack spare slots, so the last frame_stack
+        of them are always one view of it, and stacking costs one slot written and one copy of that view per step.
+        """
+        frame_space = self.observation_space
+        if self.delta:
+            # Bounds of the values themselves. The numbers space only bounds the map, while the row of stats under it
+            # holds any int8, down to below zero hp after the killing blow, so changes may span -255 to 255.
+            low, high = frame_space.low.astype(np.int16), frame_space.high.astype(np.int16)
+            if not self.planar:
+                low[-1], high[-1] = np.iinfo(np.int8).min, np.iinfo(np.int8).max
+            frame_space = Box(low=low - high, high=high - low, dtype=np.int16)
+            self.previous = np.zeros(self.agent_view.shape, dtype=self.agent_view.dtype)
+            self.change = np.zeros(frame_space.shape, dtype=np.int16)
+        
+        if self.frame_stack > 1:
+            self.frames = np.zeros((self.frame_stack + frame_slack,) + frame_space.shape, dtype=frame_space.dtype)
+            self.frame_idx = self.frame_stack - 1
+            stacked_shape = (self.frame_stack * frame_space.shape[0],) + frame_space.shape[1:]
+            frame_space = Box(low=np.concatenate([frame_space.low] * self.frame_stack).reshape(stacked_shape),
+                              high=np.concatenate([frame_space.high] * self.frame_stack).reshape(stacked_shape), dtype=frame_space.dtype)
+        self.observation_space = frame_space
+
+    def push_frame(self, obs: np.ndarray, new_episode: bool = False) -> np.ndarray:
+        """
+        Turns a translated observation into what the agent is given, its change since the last step in delta mode,
+        stacked after the frames before it. A new episode starts from no change and from empty frames.
+
+        Args:
+            obs (np.ndarray): The observation just translated.
+            new_episode (bool, optional): Whether the observation starts an episode. Defaults to False.
+
+        Returns:
+            np.ndarray: Copy of the frames given to the agent, which later steps and resets can't change.
+        """
+        if self.delta:
+            if new_episode:
+                self.previous[:] = 0
+            np.subtract(obs, self.previous, out=self.change, dtype=self.change.dtype)
+            np.copyto(self.previous, obs)
+            obs = self.change
+        if self.frame_stack == 1:
+            return np.copy(obs)
+        
+        if new_episode:
+            self.frames[:self.frame_stack - 1] = 0
+            self.frame_idx = self.frame_stack - 2
+        elif self.frame_idx + 1 == len(self.frames):
+            self.frames[:self.frame_stack - 1] = self.frames[self.frame_idx - self.frame_stack + 2:]
+            self.frame_idx = self.frame_stack - 2
+        self.frame_idx += 1
+        self.frames[self.frame_idx] = obs
+        return self.stacked_frames()
+
+    def stacked_frames(self) -> np.ndarray:
+        """
+        Gets a copy of the last frame_stack frames, oldest first, joined along their first axis. The frames are one view
+        of the buffer, so they are copied in one go.
+        """
+        frames = self.frames[self.frame_idx - self.frame_stack + 1:self.frame_idx + 1]
+        return frames.reshape(self.observation_space.shape).copy()
+
+    def new_engine(self) -> Engine:
+        """
+        Starts a new game with the environment's player and settings, in an engine that records its timings when profiling.
+        """
+        kwargs = dict(map_size=self.map_size, level_pool=self.level_pool, fov_radius=self.fov_radius, shadowcasting=self.shadowcasting)
+        if self.profiler is None:
+            return Engine(self.player, self.seed_num, self.fixed_seed, **kwargs)
+        return ProfiledEngine(self.profiler, self.player, self.seed_num, self.fixed_seed, **kwargs)
+
+    def instrument(self) -> None:
+        """
+        Swaps the environment's methods for timed versions recording into the profiler, so that nothing is timed without one.
+        Translating the map is recorded as observation, which includes collecting info, and the rest of a turn after the
+        fov, bump and enemies' turns is recorded as reward.
+        """
+        profiler = self.profiler
+        self.translate_map_to_image = profiler.timed(self.translate_map_to_image, "observation")
+        self.translate_map_to_numbers = profiler.timed(self.translate_map_to_numbers, "observation")
+        self.translate_map_to_planes = profiler.timed(self.translate_map_to_planes, "observation")
+        self.collect_info = profiler.timed(self.collect_info, "info")
+        self.play = profiler.timed(self.play, "reward", exclude=("fov", "bump", "enemy_turns"))
+        
+        step = profiler.timed(self.step, "step")
+        if profiler.in_info:
+            def step_with_timings(action: int) -> Tuple[np.ndarray, int, bool, dict]:
+                profiler.last.clear()
+                next_state, reward, done, info = step(action)
+                info["timings"] = dict(profiler.last)
+                return next_state, reward, done, info
+            self.step = step_with_timings
+        else:
+            self.step = step
+
+    def start_recording(self) -> None:
+        """
+        Starts recording the game that has just begun when there is a recorder, writing the game before it if it was cut short.
+        """
+        if self.recorder is None:
+            return
+        if self.episode is not None and self.episode.actions:
+            self.recorder.write(self.episode)
+        self.episode = self.recorder.start(self.engine.seed, self.engine.depth - 1, self.engine.level.seed)
+
+    def record(self, action: int, reward: int) -> None:
+        """
+        Adds a turn to the episode being recorded, along with the level reached if the turn took an exit,
+        and writes the episode once it is done.
+        """
+        episode = self.episode
+        episode.actions.append(action)
+        episode.rewards.append(reward)
+        if self.engine.depth - 1 != episode.levels[-1][1]:
+            episode.levels.append((len(episode.actions), self.engine.depth - 1, self.engine.level.seed))
+        if self.done:
+            self.recorder.write(episode)
+            self.episode = None
+
+    def get_timings(self) -> dict:
+        """
+        Gets the summary of the time spent in each phase of a step, empty when the environment isn't profiled.
+        """
+        if self.profiler is None:
+            return {}
+        return self.profiler.summary()
 
     def set_seed(self, seed: int = 0) -> None:
         """
@@ -105,138 +331,132 @@ class RLEnv(Env):
         self.fixed_seed = True
             
 
-    def translate_map_to_image(self) -> Tuple[List[List[int]], dict]:
+    def translate_map(self) -> Tuple[np.ndarray, dict]:
         """
-        Translates map by characters into an image (for use in a convolutional neural network).
+        Translates map into the agent's observation, as an image, planes or numbers depending on the environment.
 
         Returns:
-            Tuple[List[List[int]], dict]: Tuple of the agent's map and info collected during translation.
+            Tuple[np.ndarray, dict]: Tuple of the agent's map and info collected during translation.
         """
+        if self.to_image:
+            return self.translate_map_to_image()
+        if self.planar:
+            return self.translate_map_to_planes()
+        return self.translate_map_to_numbers()
+
+    def translate_map_to_image(self) -> Tuple[np.ndarray, dict]:
+        """
+        Translates map by glyph codes into an image (for use in a convolutional neural network).
+
+        Returns:
+            Tuple[np.ndarray, dict]: Tuple of the agent's map and info collected during translation.
+        """
+        level = self.engine.level
         
-        # Initialises info to be empty per check through
-        info = {
-            "enemies": 0,
-            "potions": 0,
-            "gold": self.engine.player.gold,
-            "player health": self.engine.player.hp,
-            #"exits taken": 0,
-            "map": "",
-            "agent view": "",
-            "exits taken": 0
-        }
+        # Handles whether the agent has perfect or imperfect information.
+        np.copyto(self.screen, level.glyphs.T)
+        if not self.perfect_info:
+            np.putmask(self.screen, ~level.explored.T, glyph_codes[" "])
         
-        level_string = ""
+        stats = f"{self.engine.player.hp}   {self.engine.depth}   {self.engine.player.gold}"
+        self.agent_view = self.renderer.render(self.screen, stats)
         
-        # Loops over actual map to translate it into the agent's view.
-        for y in range(self.engine.level.height):
-            for x in range(self.engine.level.width):
+        info = self.collect_info()
+        if self.verbosity >= 1:
+            info["agent view"] = grid_string(self.screen)
 
-                # Handles whether the agent has perfect or imperfect information.
-                if self.perfect_info:
-                    level_string += self.engine.level.tiles[x,y].char
-                else:
-                    if self.engine.layout.tiles[x,y].explored:
-                        level_string += self.engine.level.tiles[x,y].char
-                    else:
-                        level_string += " "
-                
-                # Adds enemies and potions to info for better logs
-                if self.engine.level.tiles[x,y].char == "+":
-                    info["potions"] += 1
-                elif self.engine.level.tiles[x,y].char == "v" or self.engine.level.tiles[x,y].char == "z":
-                    info["enemies"] += 1
-                if self.engine.level.tiles[x,y].char == ">":
-                    self.exit_location = (x,y)
-                    
-                # For rewarding agent for exploring tiles
-                if self.engine.layout.tiles[x,y].explored and self.engine.level.tiles[x,y].char == "." and self.engine.layout.tiles[x,y].already_explored == False:
-                    self.explored_reward += 1
-                    self.engine.layout.tiles[x,y].already_explored = True
-                
-                # Build map as well for logs
-                info["map"] += f"{self.engine.level.tiles[x,y].char}  "
-                info["agent view"] += f"{self.agent_view[y,x]}  "
-            
-            level_string += "\n"
-            info["map"] += "\n"
-            info["agent view"] += "\n"
-        info["map"] += "\n\n"
-        info["agent view"] += "\n\n"
-        
-        level_string += str(self.engine.player.hp)
-        level_string += "   "
-        level_string += str(self.engine.depth)
-        level_string += "   "
-        level_string += str(self.engine.player.gold)
-        
-        img = Image.new('RGB', (180, 280), color = 0)
-        
-        image = ImageDraw.Draw(img)
-        image.text((0,0), level_string, font=self.monospace, fill=(255, 255, 255))
-        self.agent_view = np.array(img)
-        img.close()
-
-        return self.agent_view, info
+        # The renderer keeps drawing into its frame, so the agent gets a copy that later steps and resets can't change.
+        return np.copy(self.agent_view), info
+    
+    def translate_map_to_numbers(self) -> Tuple[np.ndarray, dict]:
+        """
+        Translates map by glyph codes into integers, gathering from a lookup table straight into the agent's view.
+
+        Returns:
+            Tuple[np.ndarray, dict]: Tuple of the agent's map and info collected during translation.
+        """
+        level = self.engine.level
+        view = self.agent_view[:level.height]
+        
+        # Handles whether the agent has perfect or imperfect information.
+        np.take(number_table, level.glyphs.T, out=view)
+        if not self.perfect_info:
+            np.putmask(view, ~level.explored.T, level_translator[" "])
+        
+        self.agent_view[level.height, 0] = min(self.engine.player.hp, 127)
+        self.agent_view[level.height, 1] = min(self.engine.depth, 127)
+        self.agent_view[level.height, 2] = min(self.engine.player.gold, 127)
+        
+        info = self.collect_info()
+        if self.verbosity >= 1:
+            info["agent view"] = number_string(view)
+
+        # The view is reused every step, so the agent gets a copy that later steps and resets can't change.
+        return np.copy(self.agent_view), info
     
-    def translate_map_to_numbers(self) -> Tuple[List[List[int]], dict]:
+    def translate_map_to_planes(self) -> Tuple[np.ndarray, dict]:
+        """
+        Translates map by glyph codes into one plane for each class of glyph, gathered from a one hot table straight
+        into the agent's view, followed by planes filled with the player's hp, depth and gold (for use in a
+        convolutional neural network without rendering the map).
+
+        Returns:
+            Tuple[np.ndarray, dict]: Tuple of the agent's map and info collected during translation.
+        """
+        level = self.engine.level
+        
+        # Handles whether the agent has perfect or imperfect information.
+        np.copyto(self.screen, level.glyphs.T)
+        if not self.perfect_info:
+            np.putmask(self.screen, ~level.explored.T, glyph_codes[" "])
+        
+        np.take(plane_table, self.screen, axis=1, out=self.agent_view[:len(plane_glyphs)])
+        # Hp drops below zero when a blow is bigger than what was left, so stats are clipped to both ends of the planes.
+        self.agent_view[len(plane_glyphs)] = min(max(self.engine.player.hp, 0), 255)
+        self.agent_view[len(plane_glyphs) + 1] = min(max(self.engine.depth, 0), 255)
+        self.agent_view[len(plane_glyphs) + 2] = min(max(self.engine.player.gold, 0), 255)
+        
+        info = self.collect_info()
+        if self.verbosity >= 1:
+            info["agent view"] = grid_string(self.screen)
+
+        # The planes are reused every step, so the agent gets a copy that later steps and resets can't change.
+        return np.copy(self.agent_view), info
+
+    def collect_info(self) -> dict:
         """
-        Translates map by characters into integers.
+        Counts enemies and potions for better logs and finds the exit, from the level's registries of entities which
+        are kept up to date as entities come and go, so nothing scans the map. The map for logs is only built when
+        the verbosity asks for it.
 
         Returns:
-            Tuple[List[List[int]], dict]: Tuple of the agent's map and info collected during translation.
+            dict: Info collected from the level, without the agent's view.
         """
+        level = self.engine.level
+        potions = 0
+        for item in level.items.values():
+            if item.char == ">":
+                self.exit_location = item.pos
+            else:
+                potions += 1
         
-        # Initialises info to be empty per check through
         info = {
-            "enemies": 0,
-            "potions": 0,
+            "enemies": len(level.enemies),
+            "potions": potions,
             "gold": self.engine.player.gold,
-            "player health": self.engine.player.hp,
-            #"exits taken": 0,
-            "map": "",
-            "agent view": "",
-            "exits taken": 0
+            "player health": self.engine.player.hp
         }
         
-        # Loops over actual map to translate it into the agent's view.
-        for y in range(self.engine.level.height):
-            for x in range(self.engine.level.width):
-
-                # Handles whether the agent has perfect or imperfect information.
-                if self.perfect_info:
-                    self.agent_view[y,x] = level_translator[ self.engine.level.tiles[x,y].char ]
-                else:
-                    if self.engine.layout.tiles[x,y].explored:
-                        self.agent_view[y,x] = level_translator[ self.engine.level.tiles[x,y].char ]
-                    else:
-                        self.agent_view[y,x] = level_translator[" "]
-                
-                # Adds enemies and potions to info for better logs
-                if self.engine.level.tiles[x,y].char == "+":
-                    info["potions"] += 1
-                elif self.engine.level.tiles[x,y].char == "v" or self.engine.level.tiles[x,y].char == "z":
-                    info["enemies"] += 1
-                elif self.engine.level.tiles[x,y].char == ">":
-                    self.exit_location = (x,y)
-                    
-                # For rewarding agent for exploring tiles
-                if self.engine.layout.tiles[x,y].explored and self.engine.level.tiles[x,y].char == "." and self.engine.layout.tiles[x,y].already_explored == False:
-                    self.explored_reward += 1
-                    self.engine.layout.tiles[x,y].already_explored = True
-                
-                # Build map as well for logs
-                info["map"] += f"{self.engine.level.tiles[x,y].char}  "
-                info["agent view"] += f"{self.agent_view[y,x]}  "
-            info["map"] += "\n"
-            info["agent view"] += "\n"
-        info["map"] += "\n\n"
-        info["agent view"] += "\n\n"
+        # Build map as well for logs
+        if self.verbosity >= 1:
+            info["map"] = grid_string(level.glyphs.T)
+            info["agent view"] = ""
         
-        self.agent_view[self.engine.level.height, 0] = self.engine.player.hp
-        self.agent_view[self.engine.level.height, 1] = self.engine.depth
-        self.agent_view[self.engine.level.height, 2] = self.engine.player.gold
-
-        return self.agent_view, info
+        info["exits taken"] = self.exits_taken
+        info["enemies killed"] = self.enemies_killed
+        info["potions taken"] = self.potions_taken
+        info["depth"] = self.engine.depth
+        return info
 
     def step(self, action: int) -> Tuple[List[List[int]], int, bool, dict]:
         """
@@ -251,11 +471,38 @@ class RLEnv(Env):
             if the episode is done, and an info dictionary
         """
 
-        self.engine.fov()
+        reward = self.play(action)
+        
+        next_state, info = self.translate_map()
+        if self.frame_stack > 1 or self.delta:
+            next_state = self.push_frame(next_state)
+        
+        return next_state, reward, self.done, info
+
+    def play(self, action: int) -> int:
+        """
+        Plays one turn of the game without translating the map, shared by step and the batched environment.
+
+        Args:
+            action (int): The discrete action chose by the agent from the action space.
+
+        Returns:
+            int: Reward from the turn, including the reward for exploring.
+        """
+
+        # Floor tiles seen for the first time are counted by the fov itself, so exploring is rewarded without scanning the map.
+        newly_explored = self.engine.fov()
         reward = 0
+        action_idx = action
         action = action_translator[action]
         action_type, dest = self.engine.bump(self.engine.player.pos, action)
         
+        # Counted for logs and evaluation, whatever the reward functions in use.
+        if action_type == Attack and dest.is_dead():
+            self.enemies_killed += 1
+        elif action_type == Take and dest.char == "+":
+            self.potions_taken += 1
+        
         # ****** Reward Functions: Feel free to uncomment out what you want to use (made hastily for deadline). ******
         
         # Rewards agent for walking towards the exit path, but removes that reward if agent walks away.
@@ -270,7 +517,6 @@ class RLEnv(Env):
 
         """if action_type == Attack and dest.is_dead():
             reward += 20
-            self.enemies_killed += 1
         elif dest.char == "#":
             reward -= 1
         elif dest.char == "z":
@@ -282,8 +528,7 @@ class RLEnv(Env):
             reward += 150
         """elif dest.char == "+":
             reward += 3 * abs(self.last_hp - self.engine.player.hp)
-            self.last_hp = copy.deepcopy(self.engine.player.hp)
-            self.potions_taken += 1"""
+            self.last_hp = copy.deepcopy(self.engine.player.hp)"""
             
         # ****** End of Main Reward Functions ******
 
@@ -304,18 +549,58 @@ class RLEnv(Env):
             self.done = True
         
         self.time_spent += 1
-        if self.to_image:
-            next_state, info = self.translate_map_to_image()
-        else:
-            next_state, info = self.translate_map_to_numbers()
-            
+        
         # Rewarding agent for exploring
-        reward += ceil(self.explored_reward/2)
-        self.explored_reward = 0
+        reward += ceil(newly_explored/2)
         
-        info["exits taken"] = self.exits_taken
+        if self.episode is not None:
+            self.record(action_idx, reward)
         
-        return next_state, reward, self.done, info
+        return reward
+
+    def snapshot(self) -> Tuple[EngineState, tuple]:
+        """
+        Copies the state of the game and the environment's counters, along with its past frames when stacking or in delta mode,
+        to be put back later with RLEnv.restore.
+
+        Returns:
+            Tuple[EngineState, tuple]: The game's state and the environment's counters.
+        """
+        frames = None
+        if self.frame_stack > 1 or self.delta:
+            frames = (self.stacked_frames() if self.frame_stack > 1 else None,
+                      (np.copy(self.previous), np.copy(self.change)) if self.delta else None)
+        counters = (self.time_spent, self.path_reward, self.last_hp, self.exits_taken,
+                    self.enemies_killed, self.potions_taken, self.done, frames)
+        return self.engine.snapshot(), counters
+    
+    def restore(self, state: Tuple[EngineState, tuple]) -> np.ndarray:
+        """
+        Puts the game and the environment's counters back into a state made by RLEnv.snapshot.
+
+        Args:
+            state (Tuple[EngineState, tuple]): The state to restore.
+
+        Returns:
+            np.ndarray: The agent's observation of the restored state.
+        """
+        engine_state, counters = state
+        self.engine.restore(engine_state)
+        obs, info = self.translate_map()
+        
+        (self.time_spent, self.path_reward, self.last_hp, self.exits_taken,
+         self.enemies_killed, self.potions_taken, self.done, frames) = counters
+        if frames is not None:
+            stacked, changes = frames
+            if self.delta:
+                np.copyto(self.previous, changes[0])
+                np.copyto(self.change, changes[1])
+                obs = np.copy(self.change)
+            if self.frame_stack > 1:
+                self.frame_idx = self.frame_stack - 1
+                self.frames[:self.frame_stack] = stacked.reshape(self.frames[:self.frame_stack].shape)
+                obs = self.stacked_frames()
+        return obs
 
     def render(self, mode="human") -> None:
         raise NotImplementedError
@@ -323,14 +608,19 @@ class RLEnv(Env):
     def reset(self) -> List[List[int]]:
         # Resets all necessary values.
         self.player = copy.deepcopy(player)
-        self.engine = Engine(self.player, self.seed_num, self.fixed_seed)
+        last_engine, self.engine = self.engine, self.new_engine()
+        
+        # Levels pooled for a fixed seed the game has moved on from would never be taken.
+        if self.level_pool is not None and last_engine.fixed_seed and (not self.engine.fixed_seed or self.engine.seed != last_engine.seed):
+            self.level_pool.release(last_engine.seed)
         self.time_spent = 0
         self.path_reward = 0
-        self.explored_reward = 0
         self.exits_taken = 0
+        self.enemies_killed = 0
+        self.potions_taken = 0
         self.done = False
-        if self.to_image:
-            obs, info = self.translate_map_to_image()
-        else:
-            obs, info = self.translate_map_to_numbers()
+        self.start_recording()
+        obs, info = self.translate_map()
+        if self.frame_stack > 1 or self.delta:
+            obs = self.push_frame(obs, new_episode=True)
         return obs
\ No newline at end of file
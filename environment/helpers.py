@@ -1,9 +1,87 @@
 from gym import Env
+from typing import Dict, List, Optional, Sequence, Tuple
 
 from stable_baselines3 import PPO, A2C, DQN
-from stable_baselines3.common.callbacks import StopTrainingOnRewardThreshold, EvalCallback
+from stable_baselines3.common.callbacks import BaseCallback, StopTrainingOnRewardThreshold, EvalCallback
 
 import os
+import threading
+import numpy as np
+from collections import deque
+from queue import SimpleQueue
+from statistics import NormalDist
+
+from stable_baselines3.common.vec_env import DummyVecEnv, VecEnv
+
+from src.world.level_pool import LevelPool
+from src.utilities.terminal import TerminalRenderer
+from src.utilities.profiler import Profiler
+from environment.environment import RLEnv
+from environment.subproc_env import SharedMemoryVecEnv
+from environment.recorder import TrajectoryRecorder
+from environment.rollouts import RolloutWriter, RolloutDataset
+from environment.policies import GridCNN
+
+class TimingCallback(BaseCallback):
+
+    def __init__(self, verbose: int = 0) -> None:
+        """
+        Logs the first environment's step timings to the model's logger, like tensorboard, at the end of every rollout.
+        The environments must be made with a Profiler for there to be anything to log.
+
+        Args:
+            verbose (int, optional): Verbosity of the callback. Defaults to 0.
+        """
+        super().__init__(verbose)
+
+    def _on_step(self) -> bool:
+        return True
+
+    def _on_rollout_end(self) -> None:
+        timings = self.training_env.env_method("get_timings", indices=0)[0]
+        for phase, summary in timings.items():
+            for key in ("mean_us", "p50_us", "p99_us"):
+                self.logger.record(f"timings/{phase}_{key}", summary[key])
+
+class BackgroundWriter:
+
+    def __init__(self, path: str, buffer_size: int = 2**20) -> None:
+        """
+        Writes text to a file from a background thread through a large buffer, so the caller only hands the text over
+        and never waits on the disk. Text is written in the order it was given.
+
+        Args:
+            path (str): File to write to, replaced if it exists.
+            buffer_size (int, optional): Size of the file's buffer in bytes. Defaults to 1 MiB.
+        """
+        self.file = open(path, "w", buffering=buffer_size)
+        self.queue: SimpleQueue = SimpleQueue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        """
+        Writes text from the queue until the writer is closed.
+        """
+        while True:
+            text = self.queue.get()
+            if text is None:
+                break
+            self.file.write(text)
+        self.file.close()
+
+    def write(self, text: str) -> None:
+        """
+        Hands text over to be written.
+        """
+        self.queue.put(text)
+
+    def close(self) -> None:
+        """
+        Waits for all the text to be written and closes the file.
+        """
+        self.queue.put(None)
+        self.thread.join()
 
 def next_available(file_name: str, save_path: str, end: str = "") -> str:
     """
@@ -11,7 +89,7 @@ def next_available(file_name: str, save_path: str, end: str = "") -> str:
 
     Args:
         file_name (str): The file name to save.
-        save_path (str): The path to save to.
+        save_path (str): The directory to save in.
         end (str, optional): The file suffix (eg: .zip). Defaults to "".
 
     Returns:
@@ -19,12 +97,52 @@ def next_available(file_name: str, save_path: str, end: str = "") -> str:
     """
 
     i = 0
-    while os.path.exists(save_path + file_name + str(i) + ".txt"):
+    while os.path.exists(os.path.join(save_path, file_name + str(i) + ".txt")):
         i += 1
-    return save_path + file_name + str(i) + end
+    return os.path.join(save_path, file_name + str(i) + end)
     
 
-def create_train_model(algo: str, path_to_save: str, total_timesteps: int, env: Env, mlp: bool = False):
+def make_env(seed: int = 0, fixed_seed: bool = False, to_image: bool = False, perfect_info: bool = True, planar: bool = False, num_workers: int = 0, num_envs: int = 1,
+             map_size: Tuple[int, int] = (15, 18), level_pool: Optional[LevelPool] = None, fov_radius: int = 3, shadowcasting: bool = False,
+             recorder: Optional[TrajectoryRecorder] = None, verbosity: int = 0, frame_stack: int = 1, delta: bool = False,
+             profile: bool = False) -> VecEnv:
+    """
+    Makes the vectorized environment a model trains on: games in worker processes when there are workers,
+    and otherwise games stepped one after another in this process.
+
+    Args:
+        seed (int, optional): Seed of the first game. Defaults to 0.
+        fixed_seed (bool, optional): Write as true if you want to run with seed. Defaults to False.
+        to_image (bool, optional): Whether the games are displayed to the agent as images. Defaults to False.
+        perfect_info (bool, optional): Whether the agent sees the whole map. Defaults to True.
+        planar (bool, optional): Whether the games are displayed to the agent as planes for a Cnn, see RLEnv. Defaults to False.
+        num_workers (int, optional): Number of worker processes to run games in, 0 to run them in this process. Defaults to 0.
+        num_envs (int, optional): Number of games to step one after another without workers, each seeded one higher
+            than the last. Defaults to 1.
+        map_size (Tuple[int, int], optional): Height and width of every level. Defaults to (15, 18).
+        level_pool (Optional[LevelPool], optional): Pool of pre-generated levels, only without workers. Defaults to None.
+        fov_radius (int, optional): Number of tiles the agent sees in every direction. Defaults to 3.
+        shadowcasting (bool, optional): Whether walls hide the tiles behind them from the agent. Defaults to False.
+        recorder (Optional[TrajectoryRecorder], optional): Recorder to write every episode to, only without workers. Defaults to None.
+        verbosity (int, optional): Detail of the info dictionaries, 0 for counters only and 1 to add the map and the agent's view as text. Defaults to 0.
+        frame_stack (int, optional): Number of the last observations given to the agent at once, see RLEnv. Defaults to 1.
+        delta (bool, optional): Whether the agent is given the changes since the last step, see RLEnv. Defaults to False.
+        profile (bool, optional): Whether every game times its steps with its own Profiler, see RLEnv.get_timings. Defaults to False.
+
+    Returns:
+        VecEnv: The environment.
+    """
+    if num_workers > 0:
+        return SharedMemoryVecEnv(num_workers, seed=seed, to_image=to_image, fixed_seed=fixed_seed, perfect_info=perfect_info, planar=planar,
+                                  map_size=map_size, fov_radius=fov_radius, shadowcasting=shadowcasting, verbosity=verbosity,
+                                  frame_stack=frame_stack, delta=delta, profile=profile)
+    envs = [RLEnv(seed=seed + i, to_image=to_image, fixed_seed=fixed_seed, perfect_info=perfect_info, planar=planar, map_size=map_size,
+                  level_pool=level_pool, fov_radius=fov_radius, shadowcasting=shadowcasting, recorder=recorder, verbosity=verbosity,
+                  frame_stack=frame_stack, delta=delta, profiler=Profiler() if profile else None) for i in range(max(num_envs, 1))]
+    return DummyVecEnv([lambda env=env: env for env in envs])
+
+def create_train_model(algo: str, path_to_save: str, total_timesteps: int, env: Env, mlp: bool = False, log_dir: Optional[str] = None, verbose: int = 1,
+                       profile: bool = False):
     """
     Creates and trains a model.
 
@@ -34,6 +152,11 @@ def create_train_model(algo: str, path_to_save: str, total_timesteps: int, env:
         total_timesteps (int): Total timesteps to train agent for.
         env (Env): The environment to build the model from.
         mlp (bool): Determines whether the model is a multi-layer perceptron or a convolutional neural network.
+            Convolutional networks of planar observations use GridCNN, which fits levels of any size.
+        log_dir (Optional[str], optional): Directory for tensorboard logs and the best models. Defaults to the Environment folder.
+        verbose (int, optional): Verbosity of the model and its evaluation. Defaults to 1.
+        profile (bool, optional): Whether to log the step timings of an environment made with profile to tensorboard
+            with TimingCallback. Defaults to False.
 
     Returns:
         The model used.
@@ -44,22 +167,33 @@ def create_train_model(algo: str, path_to_save: str, total_timesteps: int, env:
     
     #callback_on_best = StopTrainingOnRewardThreshold(reward_threshold=300, verbose=1)
     
-    eval_callback = EvalCallback(env, verbose=1, n_eval_episodes=5, best_model_save_path="Environment\\BestModels\\")
+    if log_dir is None:
+        tensorboard_log, best_model_save_path = os.path.join("Environment", "Logs"), os.path.join("Environment", "BestModels")
+    else:
+        tensorboard_log, best_model_save_path = os.path.join(log_dir, "Logs"), os.path.join(log_dir, "BestModels")
+    
+    eval_callback = EvalCallback(env, verbose=verbose, n_eval_episodes=5, best_model_save_path=best_model_save_path)
     if mlp:
         if algo == "PPO":
-            model = PPO('MlpPolicy', env, verbose=1, tensorboard_log="Environment\\Logs\\", gamma=0.99)
+            model = PPO('MlpPolicy', env, verbose=verbose, tensorboard_log=tensorboard_log, gamma=0.99)
         elif algo == "A2C":
-            model = A2C('MlpPolicy', env, verbose=1, tensorboard_log="Environment\\Logs\\", gamma=0.99)
+            model = A2C('MlpPolicy', env, verbose=verbose, tensorboard_log=tensorboard_log, gamma=0.99)
         else:
-            model = DQN('MlpPolicy', env, verbose=1, tensorboard_log="Environment\\Logs\\", gamma=0.99)
+            model = DQN('MlpPolicy', env, verbose=verbose, tensorboard_log=tensorboard_log, gamma=0.99)
     else:
+        policy_kwargs = {"features_extractor_class": GridCNN} if env.get_attr("planar")[0] else None
         if algo == "PPO":
-            model = PPO('CnnPolicy', env, verbose=1, tensorboard_log="Environment\\Logs\\", gamma=0.99)
+            model = PPO('CnnPolicy', env, verbose=verbose, tensorboard_log=tensorboard_log, gamma=0.99, policy_kwargs=policy_kwargs)
         elif algo == "A2C":
-            model = A2C('CnnPolicy', env, verbose=1, tensorboard_log="Environment\\Logs\\", gamma=0.99)
+            model = A2C('CnnPolicy', env, verbose=verbose, tensorboard_log=tensorboard_log, gamma=0.99, policy_kwargs=policy_kwargs)
         else:
-            model = DQN('CnnPolicy', env, verbose=1, tensorboard_log="Environment\\Logs\\", gamma=0.99)
-    model.learn(total_timesteps=total_timesteps, callback=eval_callback, n_eval_episodes=5)
+            model = DQN('CnnPolicy', env, verbose=verbose, tensorboard_log=tensorboard_log, gamma=0.99, policy_kwargs=policy_kwargs)
+    # Planes, stacked or not, are laid out as the policy expects, so nothing may have been wrapped around them.
+    # Images are the exception, as Stable Baselines transposes them to channels first.
+    if env.get_attr("planar")[0] and model.observation_space.shape != env.observation_space.shape:
+        raise ValueError(f"Policy sees observations of shape {model.observation_space.shape} instead of {env.observation_space.shape}")
+    callback = [eval_callback, TimingCallback()] if profile else eval_callback
+    model.learn(total_timesteps=total_timesteps, callback=callback, n_eval_episodes=5)
     model.save(path_to_save)
     
     return model  
@@ -84,25 +218,33 @@ def load_model(algo: str, path_to_load: str, env: Env):
         model = DQN.load(path_to_load, env=env)
     return model
 
-def test_model(model: PPO, env: Env) -> None:
+def test_model(model: PPO, env: Env, log_dir: Optional[str] = None) -> None:
     """
-    Tests model and logs extremely detailed customised logs.
+    Tests model and logs extremely detailed customised logs. Episodes and logs follow the environment's first game,
+    so the environment may hold any number of games.
 
     Args:
         model (A2C): The model to test against.
         env (Env): The environment used for the model.
+        log_dir (Optional[str], optional): Directory for the logs. Defaults to the Environment folder.
     """
     
     log_name = "CustomLog"
-    custom_log_path = os.path.join('Environment', 'Custom Logs') + "\\"
+    custom_log_path = os.path.join(log_dir or 'Environment', 'Custom Logs')
+    os.makedirs(custom_log_path, exist_ok=True)
     full_custom_path = next_available(log_name, custom_log_path, ".txt")
 
     log_name = "FormalLog"
-    formal_log_path = os.path.join('Environment', 'Formal Logs') + "\\"
+    formal_log_path = os.path.join(log_dir or 'Environment', 'Formal Logs')
+    os.makedirs(formal_log_path, exist_ok=True)
     full_formal_path = next_available(log_name, formal_log_path, ".txt")
     
-    custom_log = open(full_custom_path, 'w')
-    formal_log = open(full_formal_path, 'w')
+    custom_log = BackgroundWriter(full_custom_path)
+    formal_log = BackgroundWriter(full_formal_path)
+    
+    # The map and the agent's view are only built for the logs while testing.
+    verbosity = env.get_attr("verbosity")
+    env.set_attr("verbosity", 1)
     
     episodes = 10
     for episode in range(1, episodes+1):
@@ -113,28 +255,172 @@ def test_model(model: PPO, env: Env) -> None:
         
         while not done:
             action, _ = model.predict(obs)
-            obs, reward, done, info = env.step(action)
+            obs, reward, dones, info = env.step(action)
+            done = dones[0]
             score += reward
             turn += 1
             if turn % 5 == 0:
                 exits_taken = info[0]["exits taken"]
                 potions = info[0]["potions"]
                 enemies = info[0]['enemies']
-                custom_log.write(f"!!! Episode: {episode} !!!\n")
-                custom_log.write(f"Score: {int(score[0])}\n")
-                custom_log.write(f"Turn: {turn}\n")
+                header = f"!!! Episode: {episode} !!!\nScore: {int(score[0])}\nTurn: {turn}\n"
                 
-                formal_log.write(f"!!! Episode: {episode} !!!\n")
-                formal_log.write(f"Score: {int(score[0])}\n")
-                formal_log.write(f"Turn: {turn}\n")
-                formal_log.write(f"Exits taken: {exits_taken}\n")
-                formal_log.write(f"Potions in map: {potions}\n")
-                formal_log.write(f"Enemies in map: {enemies}\n\n\n")
+                formal_log.write(f"{header}Exits taken: {exits_taken}\nPotions in map: {potions}\nEnemies in map: {enemies}\n\n\n")
                 
+                lines = [header]
                 for key in info[0]:
                     if key in ["map", "agent view"]:
-                        custom_log.write(f"{key}:\n {info[0][key]}\n")
+                        lines.append(f"{key}:\n {info[0][key]}\n")
                     else:
-                        custom_log.write(f"{key}: {info[0][key]}\n")
+                        lines.append(f"{key}: {info[0][key]}\n")
+                custom_log.write("".join(lines))
+    
+    for env_idx, env_verbosity in enumerate(verbosity):
+        env.set_attr("verbosity", env_verbosity, indices=env_idx)
     custom_log.close()
-    formal_log.close()
\ No newline at end of file
+    formal_log.close()
+
+def watch_model(model: PPO, env: VecEnv, episodes: int = 1, deterministic: bool = True, max_fps: Optional[float] = 10) -> None:
+    """
+    Shows a model playing the environment's first game live in the terminal, drawing only what changes every step.
+
+    Args:
+        model (PPO): The model to watch.
+        env (VecEnv): The environment used for the model.
+        episodes (int, optional): Number of episodes to watch. Defaults to 1.
+        deterministic (bool, optional): Whether the model picks its best actions instead of sampling them. Defaults to True.
+        max_fps (Optional[float], optional): Most steps shown a second. Defaults to 10.
+    """
+    renderer = TerminalRenderer(max_fps=max_fps)
+    obs = env.reset()
+    for _ in range(episodes):
+        done = False
+        while not done:
+            engine = env.get_attr("engine", indices=0)[0]
+            renderer.draw(engine.level, engine.player)
+            actions, _ = model.predict(obs, deterministic=deterministic)
+            obs, rewards, dones, infos = env.step(actions)
+            done = dones[0]
+    renderer.close()
+
+def export_rollouts(model: PPO, env: VecEnv, directory: str, episodes: int, deterministic: bool = False, chunk_steps: Optional[int] = None) -> RolloutDataset:
+    """
+    Plays a model and streams every step to a memory mapped dataset for offline learning, one stream for each of the
+    environment's games. Nothing but the current step is held in memory, so datasets can be far bigger than memory.
+
+    Args:
+        model (PPO): The model to play.
+        env (VecEnv): The environment used for the model.
+        directory (str): Directory to write the dataset in.
+        episodes (int): Number of episodes to finish, counted over every game. Other games stop wherever they are then.
+        deterministic (bool, optional): Whether the model picks its best actions instead of sampling them. Defaults to False.
+        chunk_steps (Optional[int], optional): Steps in each chunk of the dataset. Defaults to RolloutWriter's.
+
+    Returns:
+        RolloutDataset: The dataset written.
+    """
+    writer = RolloutWriter(directory, env.observation_space.shape, env.observation_space.dtype, env.num_envs, chunk_steps)
+    obs = env.reset()
+    finished = 0
+    while finished < episodes:
+        action, _ = model.predict(obs, deterministic=deterministic)
+        next_obs, reward, done, info = env.step(action)
+        writer.append(obs, action, reward, done)
+        finished += int(done.sum())
+        obs = next_obs
+    writer.close()
+    return RolloutDataset(directory)
+
+# Metrics of every evaluated episode, by name, with the info key they are read from at the end of the episode.
+episode_metrics = {
+    "return": None,
+    "length": None,
+    "exits taken": "exits taken",
+    "enemies killed": "enemies killed",
+    "potions taken": "potions taken",
+    "depth": "depth"
+}
+
+def summarise_episodes(episodes: List[dict], confidence: float = 0.95) -> Dict[str, Dict[str, float]]:
+    """
+    Summarises the metrics of many episodes, with confidence intervals of their means from the normal approximation,
+    which holds well for the hundreds of episodes an evaluation runs.
+
+    Args:
+        episodes (List[dict]): Metrics of every episode, from evaluate_model.
+        confidence (float, optional): Confidence of the intervals. Defaults to 0.95.
+
+    Returns:
+        Dict[str, Dict[str, float]]: For each metric, its mean, standard deviation, the bounds of the interval, minimum and maximum.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    summary = {}
+    for name in episode_metrics:
+        values = np.array([episode[name] for episode in episodes], dtype=float)
+        std = float(values.std(ddof=1)) if len(values) > 1 else 0.0
+        half_width = z * std / len(values)**0.5
+        mean = float(values.mean())
+        summary[name] = {
+            "mean": mean,
+            "std": std,
+            "ci_low": mean - half_width,
+            "ci_high": mean + half_width,
+            "min": float(values.min()),
+            "max": float(values.max())
+        }
+    return summary
+
+def evaluate_model(model: PPO, env: VecEnv, seeds: Sequence[int], deterministic: bool = True, confidence: float = 0.95) -> Tuple[dict, List[dict]]:
+    """
+    Evaluates a model with one episode for every seed, played by all of the environment's games at once, so that a
+    SharedMemoryVecEnv spreads them over its worker processes. Actions for every game are predicted in one batch each
+    step. Each game is given the seed of its next episode as soon as it starts one, so the environment's own reset
+    after a finished episode starts the next seed. Seeds are fixed, so an episode doesn't depend on which game played it.
+
+    Args:
+        model (PPO): The model to evaluate.
+        env (VecEnv): The environment used for the model.
+        seeds (Sequence[int]): Seed of every episode to play, repeated for several episodes of the same seed.
+        deterministic (bool, optional): Whether the model picks its best actions instead of sampling them. Defaults to True.
+        confidence (float, optional): Confidence of the intervals in the summary. Defaults to 0.95.
+
+    Returns:
+        Tuple[dict, List[dict]]: Summary with the number of episodes and the metrics from summarise_episodes,
+        and the seed and metrics of every episode in the order they finished.
+    """
+    pending = deque(seeds)
+    current = [None] * env.num_envs
+
+    def queue_seed(env_idx: int) -> Optional[int]:
+        # Games left without a seed keep playing until every other game is done, but aren't counted.
+        if pending:
+            seed = pending.popleft()
+            env.env_method("set_seed", seed, indices=int(env_idx))
+            return seed
+
+    for env_idx in range(env.num_envs):
+        current[env_idx] = queue_seed(env_idx)
+    obs = env.reset()
+    following = [queue_seed(env_idx) if current[env_idx] is not None else None for env_idx in range(env.num_envs)]
+
+    returns = np.zeros(env.num_envs)
+    lengths = np.zeros(env.num_envs, dtype=int)
+    episodes = []
+    while any(seed is not None for seed in current):
+        actions, _ = model.predict(obs, deterministic=deterministic)
+        obs, rewards, dones, infos = env.step(actions)
+        returns += rewards
+        lengths += 1
+        for env_idx in np.flatnonzero(dones):
+            if current[env_idx] is not None:
+                info = infos[env_idx]
+                episode = {"seed": current[env_idx], "return": float(returns[env_idx]), "length": int(lengths[env_idx])}
+                episode.update((name, info[key]) for name, key in episode_metrics.items() if key is not None)
+                episodes.append(episode)
+            current[env_idx] = following[env_idx]
+            following[env_idx] = queue_seed(env_idx) if current[env_idx] is not None else None
+            returns[env_idx] = 0
+            lengths[env_idx] = 0
+
+    summary = {"episodes": len(episodes), "confidence": confidence, "metrics": summarise_episodes(episodes, confidence) if episodes else {}}
+    return summary, episodes
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import gym
+import numpy as np
+import torch
+from torch import nn
+
+from stable_baselines3.common.torch_layers import BaseFeaturesExtractor
+
+class GridCNN(BaseFeaturesExtractor):
+
+    def __init__(self, observation_space: gym.spaces.Box, features_dim: int = 256, pooled_size: int = 8) -> None:
+        """
+        Convolutional features of the planar observation. The Nature Cnn that CnnPolicy uses by default shrinks its
+        input by 36 tiles before flattening, more than a level has, so this keeps every tile through padded 3 by 3
+        convolutions and then averages them down to a fixed grid, letting CnnPolicy learn from levels of any size
+        with the same number of weights.
+        Planes are not images to Stable Baselines, so they come in unscaled and are divided by their largest values here.
+
+        Args:
+            observation_space (gym.spaces.Box): Planar observation space, shaped (channels, height, width).
+            features_dim (int, optional): Number of features out. Defaults to 256.
+            pooled_size (int, optional): Height and width of the grid the convolutions are averaged down to. Defaults to 8.
+        """
+        super().__init__(observation_space, features_dim)
+        channels = observation_space.shape[0]
+        largest = np.maximum(np.abs(observation_space.low), np.abs(observation_space.high)).max(axis=(1, 2))
+        self.register_buffer("scale", torch.as_tensor(1 / np.maximum(largest, 1), dtype=torch.float32).reshape(channels, 1, 1))
+        self.cnn = nn.Sequential(
+            nn.Conv2d(channels, 32, kernel_size=3, padding=1),
+            nn.ReLU(),
+            nn.Conv2d(32, 64, kernel_size=3, padding=1),
+            nn.ReLU(),
+            nn.AdaptiveAvgPool2d(pooled_size),
+            nn.Flatten()
+        )
+        self.linear = nn.Sequential(nn.Linear(64 * pooled_size * pooled_size, features_dim), nn.ReLU())
+
+    def forward(self, observations: torch.Tensor) -> torch.Tensor:
+        return self.linear(self.cnn(observations * self.scale))
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import copy
+import struct
+import zlib
+import numpy as np
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional, TextIO, Tuple
+
+from environment.environment import RLEnv
+from src.engine import generate_level_from_seed
+from src.entities.entity_factory import player
+from src.world.level import Level
+from src.utilities.terminal import TerminalRenderer
+
+# A trajectory file starts with a header holding the settings every episode was played with, then holds one
+# zlib compressed record per episode, each preceded by its length.
+magic = b"RGTR"
+header_format = struct.Struct("<4sBHHHB") # Magic, version, height, width, fov radius and shadowcasting.
+level_format = struct.Struct("<IHQ") # Steps taken before the level, its depth and its own seed.
+version = 1
+
+class Episode(NamedTuple):
+    """
+    One episode of a trajectory file. Levels are kept as the steps taken before reaching them, their depth and their
+    own seed, starting with the first level at step 0. Actions are the agent's discrete actions.
+    """
+    seed: int
+    levels: List[Tuple[int, int, int]]
+    actions: List[int]
+    rewards: List[int]
+
+def encode_episode(episode: Episode) -> bytes:
+    """
+    Packs an episode into bytes, four actions to a byte.
+    """
+    seed_bytes = episode.seed.to_bytes(max(1, (episode.seed.bit_length() + 7) // 8), "little")
+    actions = np.zeros(-(-len(episode.actions) // 4) * 4, dtype=np.uint8)
+    actions[:len(episode.actions)] = episode.actions
+    packed = actions[0::4] | actions[1::4] << 2 | actions[2::4] << 4 | actions[3::4] << 6
+
+    parts = [struct.pack("<B", len(seed_bytes)), seed_bytes, struct.pack("<H", len(episode.levels))]
+    parts.extend(level_format.pack(*level) for level in episode.levels)
+    parts.extend((struct.pack("<I", len(episode.actions)), packed.tobytes(), np.array(episode.rewards, dtype="<i4").tobytes()))
+    return zlib.compress(b"".join(parts), 9)
+
+def decode_episode(data: bytes) -> Episode:
+    """
+    Unpacks an episode packed by encode_episode.
+    """
+    data = zlib.decompress(data)
+    seed_length = data[0]
+    seed = int.from_bytes(data[1:1 + seed_length], "little")
+    offset = 1 + seed_length
+
+    num_levels, = struct.unpack_from("<H", data, offset)
+    offset += 2
+    levels = [level_format.unpack_from(data, offset + level_idx * level_format.size) for level_idx in range(num_levels)]
+    offset += num_levels * level_format.size
+
+    num_steps, = struct.unpack_from("<I", data, offset)
+    offset += 4
+    packed = np.frombuffer(data, dtype=np.uint8, count=-(-num_steps // 4), offset=offset)
+    offset += len(packed)
+    actions = np.stack([packed & 3, packed >> 2 & 3, packed >> 4 & 3, packed >> 6], axis=1).ravel()[:num_steps]
+    rewards = np.frombuffer(data, dtype="<i4", count=num_steps, offset=offset)
+    return Episode(seed, [tuple(level) for level in levels], actions.tolist(), rewards.tolist())
+
+class TrajectoryRecorder:
+
+    def __init__(self, path: str, map_size: Tuple[int, int] = (15, 18), fov_radius: int = 3, shadowcasting: bool = False) -> None:
+        """
+        Trajectory recorder writes the episodes of environments given it to a compact binary file: the seed of every
+        level reached, the agent's actions and the rewards, without any observations. Since the game has no other
+        randomness, that is enough for TrajectoryReplayer to play any episode again exactly. Episodes are written
+        whole once they finish, so several environments can share one recorder.
+
+        Args:
+            path (str): File to write to, replaced if it exists.
+            map_size (Tuple[int, int], optional): Height and width of the levels recorded. Defaults to (15, 18).
+            fov_radius (int, optional): Number of tiles the agent sees in every direction. Defaults to 3.
+            shadowcasting (bool, optional): Whether walls hide the tiles behind them from the agent. Defaults to False.
+        """
+        self.path = path
+        self.file: BinaryIO = open(path, "wb")
+        self.file.write(header_format.pack(magic, version, map_size[0], map_size[1], fov_radius, shadowcasting))
+
+    def start(self, seed: int, depth: int, own_seed: int) -> Episode:
+        """
+        Starts recording an episode of a game, from the game's seed and the depth and own seed of its first level.
+        """
+        return Episode(seed, [(0, depth, own_seed)], [], [])
+
+    def write(self, episode: Episode) -> None:
+        """
+        Writes an episode to the end of the file.
+        """
+        data = encode_episode(episode)
+        self.file.write(struct.pack("<I", len(data)))
+        self.file.write(data)
+        self.file.flush()
+
+    def close(self) -> None:
+        """
+        Closes the file.
+        """
+        self.file.close()
+
+def read_trajectories(path: str) -> Tuple[dict, List[Episode]]:
+    """
+    Reads a file written by TrajectoryRecorder.
+
+    Args:
+        path (str): File to read.
+
+    Returns:
+        Tuple[dict, List[Episode]]: Settings the episodes were played with, as RLEnv keyword arguments, and the episodes.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+
+    file_magic, file_version, height, width, fov_radius, shadowcasting = header_format.unpack_from(data)
+    if file_magic != magic or file_version != version:
+        raise ValueError(f"{path} is not a trajectory file of version {version}")
+    settings = {"map_size": (height, width), "fov_radius": fov_radius, "shadowcasting": bool(shadowcasting)}
+
+    episodes = []
+    offset = header_format.size
+    while offset < len(data):
+        length, = struct.unpack_from("<I", data, offset)
+        episodes.append(decode_episode(data[offset + 4:offset + 4 + length]))
+        offset += 4 + length
+    return settings, episodes
+
+class RecordedLevels:
+
+    def __init__(self, episode: Episode) -> None:
+        """
+        Recorded levels stand in for a level pool, handing an engine the levels of a recorded episode by depth.
+
+        Args:
+            episode (Episode): The episode whose levels to hand out.
+        """
+        self.seeds = {depth: own_seed for step, depth, own_seed in episode.levels}
+
+    def get(self, depth: int, seed: Optional[int] = None, map_size: Tuple[int, int] = (15, 18)) -> Level:
+        """
+        Generates the recorded level of a depth again, with a stand in player that the game swaps for its own.
+        """
+        return generate_level_from_seed(depth, copy.deepcopy(player), self.seeds[depth], map_size)
+
+class TrajectoryReplayer:
+
+    def __init__(self, path: str, to_image: bool = False, perfect_info: bool = True, planar: bool = False) -> None:
+        """
+        Trajectory replayer plays the episodes of a trajectory file again in an environment, which can show them
+        to the agent in any observation mode, whichever they were recorded in.
+
+        Args:
+            path (str): File written by TrajectoryRecorder.
+            to_image (bool, optional): Whether observations are images. Defaults to False.
+            perfect_info (bool, optional): Whether observations show the whole map. Defaults to True.
+            planar (bool, optional): Whether observations are planes. Defaults to False.
+        """
+        self.settings, self.episodes = read_trajectories(path)
+        self.env = RLEnv(to_image=to_image, perfect_info=perfect_info, planar=planar, level_pool=RecordedLevels(self.episodes[0]), **self.settings) if self.episodes else None
+
+    def replay(self, episode_idx: int) -> Iterator[Tuple[np.ndarray, int, bool]]:
+        """
+        Plays an episode again, checking that every reward and level comes out as recorded.
+
+        Args:
+            episode_idx (int): Index of the episode in the file.
+
+        Yields:
+            Tuple[np.ndarray, int, bool]: The observation after the reset and after every step, along with the step's
+            reward and whether the episode is done, reward 0 and not done for the reset. Observations are overwritten
+            by the next step, so they must be copied to be kept.
+        """
+        episode = self.episodes[episode_idx]
+        env = self.env
+        env.level_pool = RecordedLevels(episode)
+        levels = iter(episode.levels[1:])
+        next_level = next(levels, None)
+
+        yield env.reset(), 0, False
+        for step, (action, recorded_reward) in enumerate(zip(episode.actions, episode.rewards), 1):
+            obs, reward, done, info = env.step(action)
+            if reward != recorded_reward:
+                raise ValueError(f"Replay of episode {episode_idx} diverged at step {step}, reward {reward} instead of {recorded_reward}")
+            if next_level is not None and next_level[0] == step:
+                if env.engine.level.seed != next_level[2]:
+                    raise ValueError(f"Replay of episode {episode_idx} diverged at step {step}, reached another level")
+                next_level = next(levels, None)
+            yield obs, reward, done
+
+    def observation(self, episode_idx: int, step: int) -> np.ndarray:
+        """
+        Rebuilds the observation of an episode after a number of steps, 0 being the observation after the reset.
+
+        Args:
+            episode_idx (int): Index of the episode in the file.
+            step (int): Number of steps taken.
+
+        Returns:
+            np.ndarray: Copy of the observation.
+        """
+        if not 0 <= step <= len(self.episodes[episode_idx].actions):
+            raise ValueError(f"Episode {episode_idx} has no step {step}")
+        for step_idx, (obs, reward, done) in enumerate(self.replay(episode_idx)):
+            if step_idx == step:
+                return np.copy(obs)
+
+    def watch(self, episode_idx: int, max_fps: Optional[float] = 10, stream: Optional[TextIO] = None) -> None:
+        """
+        Plays an episode again in the terminal, drawing only what changes every step.
+
+        Args:
+            episode_idx (int): Index of the episode in the file.
+            max_fps (Optional[float], optional): Most steps shown a second. Defaults to 10.
+            stream (Optional[TextIO], optional): Terminal to draw on. Defaults to standard output.
+        """
+        renderer = TerminalRenderer(stream, max_fps)
+        for obs, reward, done in self.replay(episode_idx):
+            renderer.draw(self.env.engine.level, self.env.engine.player)
+        renderer.close()
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import numpy as np
+
+from typing import Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from src.world.tile import glyphs
+
+class GlyphRenderer:
+
+    # Glyph codes double as indices into the atlas, digits and the minus sign are added for the stats line.
+    alphabet = glyphs + "0123456789-"
+
+    def __init__(self, font: ImageFont.FreeTypeFont, height: int, width: int, shape: Tuple[int, int] = (0, 0)) -> None:
+        """
+        Renders the level as an image by blitting glyphs from an atlas into a reused frame. Each glyph is
+        rasterised once, and only the cells that changed since the last frame are redrawn.
+        Cells are laid out exactly like multiline text drawn with the same font, with one extra line for stats.
+
+        Args:
+            font (ImageFont.FreeTypeFont): Monospace font to rasterise glyphs with.
+            height (int): Height of the level in tiles.
+            width (int): Width of the level in tiles.
+            shape (Tuple[int, int], optional): Minimum height and width of the frame in pixels. Defaults to fitting the level.
+        """
+        self.cell_width = int(np.ceil(font.getlength(" ")))
+        self.cell_height = font.getbbox("A")[3] + 4
+        self.rows = height + 1
+        self.columns = width
+        self.codes = {char: code for code, char in enumerate(self.alphabet)}
+
+        # Rasterises every glyph once into a grayscale cell and spreads it over the RGB channels.
+        atlas = np.zeros((len(self.alphabet), self.cell_height, self.cell_width), dtype=np.uint8)
+        for code, char in enumerate(self.alphabet):
+            cell = Image.new("L", (self.cell_width, self.cell_height), color=0)
+            ImageDraw.Draw(cell).text((0,0), char, font=font, fill=255)
+            atlas[code] = np.array(cell)
+            cell.close()
+        self.atlas = np.repeat(atlas[..., np.newaxis], 3, axis=3)
+
+        # Pixel rows and columns covered by each cell, for blitting many cells in one indexing operation.
+        self.pixel_rows = np.arange(self.rows)[:, np.newaxis] * self.cell_height + np.arange(self.cell_height)
+        self.pixel_columns = np.arange(self.columns)[:, np.newaxis] * self.cell_width + np.arange(self.cell_width)
+
+        frame_height = max(shape[0], self.rows * self.cell_height)
+        frame_width = max(shape[1], self.columns * self.cell_width)
+        self.frame = np.zeros((frame_height, frame_width, 3), dtype=np.uint8)
+
+        # What is on screen now and what should be drawn next, a blank cell is all zeroes so both start as spaces.
+        self.drawn = np.full((self.rows, self.columns), self.codes[" "], dtype=np.uint8)
+        self.screen = np.full((self.rows, self.columns), self.codes[" "], dtype=np.uint8)
+
+    def render(self, grid: np.ndarray, stats: str) -> np.ndarray:
+        """
+        Draws a grid of glyph codes and a line of stats under it.
+
+        Args:
+            grid (np.ndarray): Glyph codes indexed by [y, x].
+            stats (str): Line drawn under the grid, cut off at the grid's width.
+
+        Returns:
+            np.ndarray: The frame, which is reused and overwritten by the next call.
+        """
+        np.copyto(self.screen[:-1], grid)
+        self.screen[-1] = self.codes[" "]
+        for x, char in enumerate(stats[:self.columns]):
+            self.screen[-1, x] = self.codes.get(char, self.codes[" "])
+
+        ys, xs = np.nonzero(self.screen != self.drawn)
+        if len(ys):
+            codes = self.screen[ys, xs]
+            self.frame[self.pixel_rows[ys][:, :, np.newaxis], self.pixel_columns[xs][:, np.newaxis, :]] = self.atlas[codes]
+            self.drawn[ys, xs] = codes
+
+        return self.frame
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import json
+import os
+import numpy as np
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Arrays kept for every step besides the observation, with their types.
+step_fields = {"actions": np.uint8, "rewards": np.float32, "dones": bool}
+
+# Size of the chunks an observation stream is split into when no number of steps is given.
+chunk_bytes = 256 * 2**20
+
+def chunk_path(directory: str, stream: int, chunk: int, field: str) -> str:
+    """
+    Gets the file of one field of one chunk of a stream.
+    """
+    return os.path.join(directory, f"{stream:03d}_{chunk:05d}_{field}.bin")
+
+class RolloutWriter:
+
+    def __init__(self, directory: str, observation_shape: Tuple[int, ...], observation_dtype: np.dtype, num_streams: int = 1, chunk_steps: Optional[int] = None) -> None:
+        """
+        Rollout writer streams the steps of one or more games into memory mapped files, without keeping them in memory.
+        Each game has its own stream, so its episodes are stored one after another. Streams are split into chunks of
+        a fixed number of steps, with one raw file for each of the observations, actions, rewards and dones of a chunk,
+        and an index file describing them. Steps are only ever appended, and the index is rewritten whenever a chunk
+        fills up, so a dataset can be read while it is being written.
+
+        Args:
+            directory (str): Directory to write the dataset in.
+            observation_shape (Tuple[int, ...]): Shape of one observation.
+            observation_dtype (np.dtype): Type of the observations.
+            num_streams (int, optional): Number of games written together. Defaults to 1.
+            chunk_steps (Optional[int], optional): Steps in each chunk. Defaults to about 256 MiB of observations a chunk.
+        """
+        self.directory = directory
+        self.observation_shape = tuple(observation_shape)
+        self.observation_dtype = np.dtype(observation_dtype)
+        if chunk_steps is None:
+            chunk_steps = max(1, chunk_bytes // max(1, self.observation_dtype.itemsize * int(np.prod(self.observation_shape))))
+        self.chunk_steps = chunk_steps
+
+        os.makedirs(directory, exist_ok=True)
+        self.streams = [{"chunks": [], "steps": 0, "episodes": 0} for _ in range(num_streams)]
+        self.arrays: List[Optional[Dict[str, np.memmap]]] = [None] * num_streams
+        self.write_index()
+
+    def open_chunk(self, stream: int) -> Dict[str, np.memmap]:
+        """
+        Starts a new chunk of a stream, mapping its files at full size.
+        """
+        chunk = len(self.streams[stream]["chunks"])
+        self.streams[stream]["chunks"].append(0)
+        fields = {"observations": (self.observation_dtype, self.observation_shape)}
+        fields.update((field, (np.dtype(dtype), ())) for field, dtype in step_fields.items())
+        self.arrays[stream] = {
+            field: np.memmap(chunk_path(self.directory, stream, chunk, field), dtype=dtype, mode="w+", shape=(self.chunk_steps,) + shape)
+            for field, (dtype, shape) in fields.items()
+        }
+        return self.arrays[stream]
+
+    def close_chunk(self, stream: int) -> None:
+        """
+        Finishes the current chunk of a stream, cutting its files down to the steps written.
+        """
+        arrays, self.arrays[stream] = self.arrays[stream], None
+        chunk = len(self.streams[stream]["chunks"]) - 1
+        steps = self.streams[stream]["chunks"][chunk]
+        for field in list(arrays):
+            array = arrays.pop(field)
+            array.flush()
+            row_bytes = array.itemsize * int(np.prod(array.shape[1:]))
+            
+            # The file is unmapped before it is cut down.
+            del array
+            os.truncate(chunk_path(self.directory, stream, chunk, field), steps * row_bytes)
+
+    def append(self, observations: np.ndarray, actions: np.ndarray, rewards: np.ndarray, dones: np.ndarray) -> None:
+        """
+        Appends one step of every stream: the observations acted on, the actions taken from them, and the rewards and dones they led to.
+
+        Args:
+            observations (np.ndarray): Observation of every stream, one a row.
+            actions (np.ndarray): Action of every stream.
+            rewards (np.ndarray): Reward of every stream.
+            dones (np.ndarray): Whether each stream's episode ended with the step.
+        """
+        filled = False
+        for stream, info in enumerate(self.streams):
+            arrays = self.arrays[stream]
+            if arrays is None:
+                arrays = self.open_chunk(stream)
+            row = info["chunks"][-1]
+            arrays["observations"][row] = observations[stream]
+            arrays["actions"][row] = actions[stream]
+            arrays["rewards"][row] = rewards[stream]
+            arrays["dones"][row] = dones[stream]
+
+            info["chunks"][-1] += 1
+            info["steps"] += 1
+            info["episodes"] += bool(dones[stream])
+            if info["chunks"][-1] == self.chunk_steps:
+                self.close_chunk(stream)
+                filled = True
+        if filled:
+            self.write_index()
+
+    def write_index(self) -> None:
+        """
+        Rewrites the index file, replacing the old one at once so readers never see half of it.
+        """
+        index = {
+            "observation_shape": self.observation_shape,
+            "observation_dtype": self.observation_dtype.str,
+            "fields": {field: np.dtype(dtype).str for field, dtype in step_fields.items()},
+            "chunk_steps": self.chunk_steps,
+            "streams": self.streams
+        }
+        path = os.path.join(self.directory, "index.json")
+        with open(path + ".tmp", "w") as index_file:
+            json.dump(index, index_file, indent=4)
+        os.replace(path + ".tmp", path)
+
+    def close(self) -> None:
+        """
+        Finishes every stream's last chunk and writes the final index.
+        """
+        for stream in range(len(self.streams)):
+            if self.arrays[stream] is not None:
+                self.close_chunk(stream)
+        self.write_index()
+
+class RolloutDataset:
+
+    def __init__(self, directory: str) -> None:
+        """
+        Rollout dataset reads a dataset written by RolloutWriter as read only memory mapped views, without copying it.
+        Only the steps in the index are read, so it can be opened while the dataset is being written.
+
+        Args:
+            directory (str): Directory of the dataset.
+        """
+        self.directory = directory
+        with open(os.path.join(directory, "index.json")) as index_file:
+            self.index = json.load(index_file)
+        self.observation_shape = tuple(self.index["observation_shape"])
+
+    @property
+    def num_streams(self) -> int:
+        """
+        Number of streams, one for each game written together.
+        """
+        return len(self.index["streams"])
+
+    def __len__(self) -> int:
+        """
+        Number of steps in every stream together.
+        """
+        return sum(stream["steps"] for stream in self.index["streams"])
+
+    def chunk(self, stream: int, chunk: int) -> Dict[str, np.memmap]:
+        """
+        Maps one chunk of a stream.
+
+        Args:
+            stream (int): Index of the stream.
+            chunk (int): Index of the chunk in the stream.
+
+        Returns:
+            Dict[str, np.memmap]: The chunk's observations, actions, rewards and dones, one step a row.
+        """
+        steps = self.index["streams"][stream]["chunks"][chunk]
+        fields = {"observations": (self.index["observation_dtype"], self.observation_shape)}
+        fields.update((field, (dtype, ())) for field, dtype in self.index["fields"].items())
+        return {
+            field: np.memmap(chunk_path(self.directory, stream, chunk, field), dtype=dtype, mode="r", shape=(steps,) + shape)
+            for field, (dtype, shape) in fields.items()
+        }
+
+    def chunks(self) -> Iterator[Tuple[int, Dict[str, np.memmap]]]:
+        """
+        Maps every chunk in order, stream by stream.
+
+        Yields:
+            Tuple[int, Dict[str, np.memmap]]: The stream of the chunk, and the chunk from RolloutDataset.chunk.
+        """
+        for stream, info in enumerate(self.index["streams"]):
+            for chunk, steps in enumerate(info["chunks"]):
+                if steps:
+                    yield stream, self.chunk(stream, chunk)
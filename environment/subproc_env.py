@@ -0,0 +1,183 @@
+from __future__ import annotations
+
+from stable_baselines3.common.vec_env.base_vec_env import VecEnv, VecEnvIndices, VecEnvObs, VecEnvStepReturn
+
+import gym
+import numpy as np
+import multiprocessing as mp
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, List, Optional, Tuple, Type
+
+from environment.environment import RLEnv
+from src.utilities.profiler import Profiler
+
+def worker(remote: Connection, parent_remote: Connection, env_kwargs: dict) -> None:
+    """
+    Runs one environment in a worker process. Observations are written into the worker's slot of a shared memory
+    block, so only rewards, dones and infos go through the pipe.
+
+    Args:
+        remote (Connection): The worker's end of the pipe.
+        parent_remote (Connection): The main process's end of the pipe, closed in the worker.
+        env_kwargs (dict): Keyword arguments to build the RLEnv with.
+    """
+    parent_remote.close()
+    env = RLEnv(**env_kwargs)
+    shm = None
+
+    while True:
+        cmd, data = remote.recv()
+        if cmd == "step":
+            obs, reward, done, info = env.step(data)
+            if done:
+                # Save final observation where the user can get it, then reset.
+                info["terminal_observation"] = np.copy(obs)
+                obs = env.reset()
+            obs_slot[...] = obs
+            remote.send((reward, done, info))
+        elif cmd == "reset":
+            obs_slot[...] = env.reset()
+            remote.send(None)
+        elif cmd == "get_spaces":
+            remote.send((env.observation_space, env.action_space))
+        elif cmd == "attach":
+            name, num_envs, slot = data
+            shm = SharedMemory(name=name)
+            obs_slot = np.ndarray((num_envs,) + env.observation_space.shape, dtype=env.observation_space.dtype, buffer=shm.buf)[slot]
+            remote.send(None)
+        elif cmd == "env_method":
+            method_name, method_args, method_kwargs = data
+            remote.send(getattr(env, method_name)(*method_args, **method_kwargs))
+        elif cmd == "get_attr":
+            remote.send(getattr(env, data))
+        elif cmd == "set_attr":
+            remote.send(setattr(env, data[0], data[1]))
+        elif cmd == "close":
+            env.close()
+            if shm is not None:
+                del obs_slot
+                shm.close()
+            remote.close()
+            break
+
+class SharedMemoryVecEnv(VecEnv):
+
+    def __init__(self, num_workers: int, seed: int = 0, to_image: bool = False, fixed_seed: bool = False, perfect_info: bool = True, planar: bool = False, map_size: Tuple[int, int] = (15, 18), start_method: Optional[str] = None, fov_radius: int = 3, shadowcasting: bool = False, verbosity: int = 0, frame_stack: int = 1, delta: bool = False, profile: bool = False) -> None:
+        """
+        Runs one RogueLike game per worker process so rollouts use several cores. Workers write their observations
+        straight into a shared memory block instead of pickling arrays through pipes.
+        With a fixed seed, each worker gets its own seed derived from its index so runs are reproducible.
+
+        Args:
+            num_workers (int): Number of worker processes, one game each.
+            seed (int, optional): Seed of the first worker, each next worker adds one to it. Defaults to 0.
+            to_image (bool, optional): Whether the games are displayed to the agent as images. Defaults to False.
+            fixed_seed (bool, optional): Write as true if you want to run with seed. Defaults to False.
+            perfect_info (bool, optional): Whether the agent sees the whole map. Defaults to True.
+            planar (bool, optional): Whether the games are displayed to the agent as planes for a Cnn. Defaults to False.
+            map_size (Tuple[int, int], optional): Height and width of every level. Defaults to (15, 18).
+            start_method (Optional[str], optional): Multiprocessing start method. Defaults to forkserver where available, otherwise spawn.
+            fov_radius (int, optional): Number of tiles the agent sees in every direction. Defaults to 3.
+            shadowcasting (bool, optional): Whether walls hide the tiles behind them from the agent. Defaults to False.
+            verbosity (int, optional): Detail of the info dictionaries, like RLEnv's. Defaults to 0.
+            frame_stack (int, optional): Number of the last observations given to the agent at once, like RLEnv's. Defaults to 1.
+            delta (bool, optional): Whether the agent is given the changes since the last step, like RLEnv's. Defaults to False.
+            profile (bool, optional): Whether every worker times its steps with its own Profiler, read with env_method("get_timings"). Defaults to False.
+        """
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self.waiting = False
+        self.closed = False
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(num_workers)])
+        self.processes = []
+        for worker_idx, (work_remote, remote) in enumerate(zip(self.work_remotes, self.remotes)):
+            env_kwargs = dict(seed=seed + worker_idx, to_image=to_image, fixed_seed=fixed_seed, perfect_info=perfect_info,
+                              planar=planar, map_size=map_size, fov_radius=fov_radius, shadowcasting=shadowcasting, verbosity=verbosity,
+                              frame_stack=frame_stack, delta=delta, profiler=Profiler() if profile else None)
+            process = ctx.Process(target=worker, args=(work_remote, remote, env_kwargs), daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.remotes[0].send(("get_spaces", None))
+        observation_space, action_space = self.remotes[0].recv()
+        VecEnv.__init__(self, num_workers, observation_space, action_space)
+
+        # Every worker writes into its own slot of one shared block.
+        shape = (num_workers,) + observation_space.shape
+        self.shm = SharedMemory(create=True, size=int(np.prod(shape)) * np.dtype(observation_space.dtype).itemsize)
+        self.buf_obs = np.ndarray(shape, dtype=observation_space.dtype, buffer=self.shm.buf)
+        for slot, remote in enumerate(self.remotes):
+            remote.send(("attach", (self.shm.name, num_workers, slot)))
+        for remote in self.remotes:
+            remote.recv()
+
+    def reset(self) -> VecEnvObs:
+        for remote in self.remotes:
+            remote.send(("reset", None))
+        for remote in self.remotes:
+            remote.recv()
+        return np.copy(self.buf_obs)
+
+    def step_async(self, actions: np.ndarray) -> None:
+        for remote, action in zip(self.remotes, actions):
+            remote.send(("step", int(action)))
+        self.waiting = True
+
+    def step_wait(self) -> VecEnvStepReturn:
+        results = [remote.recv() for remote in self.remotes]
+        self.waiting = False
+        rewards, dones, infos = zip(*results)
+        return np.copy(self.buf_obs), np.array(rewards, dtype=np.float32), np.array(dones, dtype=bool), list(infos)
+
+    def seed(self, seed: Optional[int] = None) -> List[Optional[int]]:
+        if seed is None:
+            seed = np.random.randint(0, 2**31 - 1)
+        for worker_idx, remote in enumerate(self.remotes):
+            remote.send(("env_method", ("set_seed", (), {"seed": seed + worker_idx})))
+        for remote in self.remotes:
+            remote.recv()
+        return [seed + worker_idx for worker_idx in range(self.num_envs)]
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        del self.buf_obs
+        self.shm.close()
+        self.shm.unlink()
+        self.closed = True
+
+    def get_attr(self, attr_name: str, indices: VecEnvIndices = None) -> List[Any]:
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("get_attr", attr_name))
+        return [remote.recv() for remote in target_remotes]
+
+    def set_attr(self, attr_name: str, value: Any, indices: VecEnvIndices = None) -> None:
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("set_attr", (attr_name, value)))
+        for remote in target_remotes:
+            remote.recv()
+
+    def env_method(self, method_name: str, *method_args, indices: VecEnvIndices = None, **method_kwargs) -> List[Any]:
+        target_remotes = self._get_target_remotes(indices)
+        for remote in target_remotes:
+            remote.send(("env_method", (method_name, method_args, method_kwargs)))
+        return [remote.recv() for remote in target_remotes]
+
+    def env_is_wrapped(self, wrapper_class: Type[gym.Wrapper], indices: VecEnvIndices = None) -> List[bool]:
+        return [False for _ in self._get_target_remotes(indices)]
+
+    def _get_target_remotes(self, indices: VecEnvIndices) -> List[Connection]:
+        return [self.remotes[i] for i in self._get_indices(indices)]
@@ -0,0 +1,259 @@
+# Non-interactive launcher, run `python launch.py --help` for its options.
+#
+# Runs are described by a JSON config file and/or flags, flags taking precedence. A config file holds the settings
+# shared by every run under "base", and either a list of runs under "runs" or lists of values to sweep under "sweep",
+# in which case a run is made for every combination:
+#
+#     {
+#         "base": {"timesteps": 100000, "perfect_info": false},
+#         "sweep": {"algorithm": ["PPO", "A2C"], "seed": [1, 2, 3]}
+#     }
+
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+# Settings of a run and their defaults. A seed of None means levels aren't seeded.
+defaults = {
+    "name": None,
+    "mode": "train",
+    "seed": None,
+    "perfect_info": True,
+    "to_image": False,
+    "planar": False,
+    "map_size": [15, 18],
+    "fov_radius": 3,
+    "shadowcasting": False,
+    "frame_stack": 1,
+    "delta": False,
+    "algorithm": "PPO",
+    "policy": "mlp",
+    "timesteps": 100000,
+    "load": None,
+    "test": False,
+    "record": False,
+    "export_episodes": 0,
+    "eval_episodes": 100,
+    "num_workers": 0,
+    "num_envs": 1,
+    "pool_workers": 0,
+    "cores": 1,
+    "profile": False
+}
+
+# Core slot of this worker process, taken once when the worker starts so that runs in parallel never share cores.
+core_slot = 0
+
+def take_core_slot(slots: mp.Queue) -> None:
+    """
+    Initialises a worker process of the pool by taking a free core slot.
+    """
+    global core_slot
+    core_slot = slots.get()
+
+def limit_cores(cores: int, slot: int) -> None:
+    """
+    Limits the current process to a number of cores, pinning it to its own cores where the platform allows it.
+
+    Args:
+        cores (int): Number of cores the run may use.
+        slot (int): Which block of cores to use, counting in blocks of that many cores.
+    """
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(cores)
+
+    import torch
+    torch.set_num_threads(cores)
+
+    if hasattr(os, "sched_setaffinity"):
+        available = sorted(os.sched_getaffinity(0))
+        start = (slot * cores) % len(available)
+        os.sched_setaffinity(0, {available[(start + core) % len(available)] for core in range(min(cores, len(available)))})
+
+def run(config: dict, output: str) -> dict:
+    """
+    Trains, tests or evaluates one model in its own output directory, writing its config and results there.
+
+    Args:
+        config (dict): Settings of the run, with every key of defaults.
+        output (str): Directory to write the run's files in.
+
+    Returns:
+        dict: Results of the run.
+    """
+    limit_cores(config["cores"], core_slot)
+
+    from src.world.level_pool import LevelPool
+    from environment.helpers import make_env, create_train_model, load_model, test_model, evaluate_model, export_rollouts
+    from environment.recorder import TrajectoryRecorder
+
+    os.makedirs(output, exist_ok=True)
+    with open(os.path.join(output, "config.json"), "w") as config_file:
+        json.dump(config, config_file, indent=4)
+
+    # Everything opened is closed even when the run fails, so failed runs don't leak worker processes or shared memory.
+    level_pool = recorder = env = None
+    try:
+        level_pool = LevelPool(config["pool_workers"]) if config["pool_workers"] > 0 and config["num_workers"] == 0 else None
+        if config["record"] and config["num_workers"] == 0:
+            recorder = TrajectoryRecorder(os.path.join(output, "trajectories.bin"), tuple(config["map_size"]), config["fov_radius"], config["shadowcasting"])
+        env = make_env(
+            seed=config["seed"] or 0, fixed_seed=config["seed"] is not None, to_image=config["to_image"],
+            perfect_info=config["perfect_info"], planar=config["planar"], map_size=tuple(config["map_size"]),
+            num_workers=config["num_workers"], num_envs=config["num_envs"],
+            level_pool=level_pool, fov_radius=config["fov_radius"], shadowcasting=config["shadowcasting"], recorder=recorder,
+            frame_stack=config["frame_stack"], delta=config["delta"], profile=config["profile"]
+        )
+
+        start = time.perf_counter()
+        if config["mode"] in ("test", "evaluate"):
+            model = load_model(config["algorithm"], config["load"], env)
+        else:
+            model = create_train_model(config["algorithm"], os.path.join(output, "model"), config["timesteps"], env,
+                                       mlp=config["policy"] == "mlp", log_dir=output, verbose=0,
+                                       profile=config["profile"])
+        elapsed = time.perf_counter() - start
+
+        if config["mode"] == "test" or config["test"]:
+            test_model(model, env, log_dir=output)
+        if config["export_episodes"] > 0:
+            export_rollouts(model, env, os.path.join(output, "rollouts"), config["export_episodes"])
+
+        results = {"name": config["name"], "seconds": elapsed, "timesteps": model.num_timesteps}
+        if config["mode"] == "evaluate":
+            # Seeds follow on from the run's seed, so evaluations with the same seed play the same levels.
+            first_seed = config["seed"] or 0
+            start = time.perf_counter()
+            evaluation, episodes = evaluate_model(model, env, range(first_seed, first_seed + config["eval_episodes"]))
+            evaluation["seconds"] = time.perf_counter() - start
+            with open(os.path.join(output, "evaluation.json"), "w") as evaluation_file:
+                json.dump({"summary": evaluation, "episodes": episodes}, evaluation_file, indent=4)
+            results["evaluation"] = evaluation
+        if config["mode"] == "train":
+            results["steps_per_second"] = model.num_timesteps / elapsed
+        if config["profile"]:
+            with open(os.path.join(output, "timings.json"), "w") as timings_file:
+                json.dump(env.env_method("get_timings"), timings_file, indent=4)
+        with open(os.path.join(output, "results.json"), "w") as results_file:
+            json.dump(results, results_file, indent=4)
+    finally:
+        if env is not None:
+            env.close()
+        if level_pool is not None:
+            level_pool.close()
+        if recorder is not None:
+            recorder.close()
+    return results
+
+def expand(config_file: Optional[dict], overrides: dict) -> List[dict]:
+    """
+    Expands a config file and flags into the list of runs to launch, naming runs that have no name.
+
+    Args:
+        config_file (Optional[dict]): Contents of the config file, if there is one.
+        overrides (dict): Settings given as flags, which apply to every run.
+
+    Returns:
+        List[dict]: Settings of every run.
+    """
+    config_file = config_file or {}
+    base = {**defaults, **config_file.get("base", {})}
+
+    if "runs" in config_file:
+        runs = [{**base, **run_config} for run_config in config_file["runs"]]
+    else:
+        sweep = config_file.get("sweep", {})
+        keys = list(sweep)
+        runs = [{**base, **dict(zip(keys, values))} for values in itertools.product(*(sweep[key] for key in keys))]
+
+    names = set()
+    for run_idx, run_config in enumerate(runs):
+        unknown = set(run_config) - set(defaults)
+        if unknown:
+            raise ValueError(f"Unknown settings in run {run_idx}: {', '.join(sorted(unknown))}")
+        run_config.update(overrides)
+        if run_config["name"] is None:
+            run_config["name"] = f"{run_idx:03d}_{run_config['algorithm']}_{run_config['policy']}_seed{run_config['seed']}"
+        elif run_config["name"] in names:
+            run_config["name"] = f"{run_config['name']}_{run_idx:03d}"
+        names.add(run_config["name"])
+    return runs
+
+def main():
+    parser = argparse.ArgumentParser(description="Launches training and testing runs without prompts, in parallel for sweeps.")
+    parser.add_argument("--config", help="JSON file describing the runs.")
+    parser.add_argument("--output", default="runs", help="Directory to put every run's directory in.")
+    parser.add_argument("--parallel", type=int, default=1, help="Number of runs at the same time.")
+    parser.add_argument("--start-method", default=None, help="Multiprocessing start method. Defaults to forkserver where available, otherwise spawn.")
+
+    # Flags for single runs, or for overriding every run of a config file.
+    parser.add_argument("--name")
+    parser.add_argument("--mode", choices=["train", "test", "evaluate"])
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--perfect-info", dest="perfect_info", type=int, choices=[0, 1])
+    parser.add_argument("--to-image", dest="to_image", type=int, choices=[0, 1])
+    parser.add_argument("--planar", type=int, choices=[0, 1], help="Whether the agent sees the map as planes, for the cnn policy.")
+    parser.add_argument("--map-size", dest="map_size", type=int, nargs=2, metavar=("HEIGHT", "WIDTH"))
+    parser.add_argument("--fov-radius", dest="fov_radius", type=int)
+    parser.add_argument("--shadowcasting", type=int, choices=[0, 1])
+    parser.add_argument("--frame-stack", dest="frame_stack", type=int, help="Number of the last observations the agent sees at once.")
+    parser.add_argument("--delta", type=int, choices=[0, 1], help="Whether the agent sees the changes since the last step instead of the map.")
+    parser.add_argument("--algorithm", choices=["DQN", "PPO", "A2C"])
+    parser.add_argument("--policy", choices=["mlp", "cnn"])
+    parser.add_argument("--timesteps", type=int)
+    parser.add_argument("--load", help="Model to load when testing or evaluating.")
+    parser.add_argument("--test", type=int, choices=[0, 1], help="Whether to test the model after training.")
+    parser.add_argument("--record", type=int, choices=[0, 1], help="Whether to write every episode to trajectories.bin, only without workers.")
+    parser.add_argument("--export-episodes", dest="export_episodes", type=int, help="Episodes to export to a rollout dataset after training or testing.")
+    parser.add_argument("--eval-episodes", dest="eval_episodes", type=int, help="Episodes to play when evaluating, one seed each.")
+    parser.add_argument("--num-workers", dest="num_workers", type=int)
+    parser.add_argument("--num-envs", dest="num_envs", type=int)
+    parser.add_argument("--pool-workers", dest="pool_workers", type=int)
+    parser.add_argument("--cores", type=int, help="Cores each run may use.")
+    parser.add_argument("--profile", type=int, choices=[0, 1], help="Whether to time every phase of a step, writing the times of every game to timings.json.")
+    args = vars(parser.parse_args())
+
+    overrides = {}
+    for key in defaults:
+        if args.get(key) is not None:
+            overrides[key] = bool(args[key]) if isinstance(defaults[key], bool) else args[key]
+
+    config_file = None
+    if args["config"]:
+        with open(args["config"]) as config:
+            config_file = json.load(config)
+    runs = expand(config_file, overrides)
+
+    start_method = args["start_method"]
+    if start_method is None:
+        start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+    ctx = mp.get_context(start_method)
+
+    slots = ctx.Queue()
+    for slot in range(args["parallel"]):
+        slots.put(slot)
+
+    print(f"Launching {len(runs)} runs, {args['parallel']} at a time...")
+    summary = []
+    with ProcessPoolExecutor(max_workers=args["parallel"], mp_context=ctx, initializer=take_core_slot, initargs=(slots,)) as executor:
+        futures = [executor.submit(run, run_config, os.path.join(args["output"], run_config["name"])) for run_config in runs]
+        for run_config, future in zip(runs, futures):
+            try:
+                results = future.result()
+                print(f"Finished {run_config['name']}.")
+            except Exception as error:
+                results = {"name": run_config["name"], "error": repr(error)}
+                print(f"Run {run_config['name']} failed: {error!r}")
+            summary.append(results)
+
+    os.makedirs(args["output"], exist_ok=True)
+    with open(os.path.join(args["output"], "summary.json"), "w") as summary_file:
+        json.dump(summary, summary_file, indent=4)
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,10 @@
-from stable_baselines3.common.vec_env import DummyVecEnv
-
 import os
 
 import torch
 import tensorflow as tf
 from src.game import Game
-from environment.environment import RLEnv
-from environment.helpers import next_available, create_train_model, load_model, test_model
+from src.world.level_pool import LevelPool
+from environment.helpers import make_env, next_available, create_train_model, load_model, test_model
 
 def main():
     mode = int(input("Agent or Game mode? (0 for agent, 1 for game)\n"))
@@ -19,7 +17,8 @@ def main():
         fixed_seed = False
     
     if mode:
-        game = Game(seed=seed, fixed_seed=fixed_seed)
+        max_fps = float(input("Most frames to draw a second? (0 for no limit)\n") or 0) or None
+        game = Game(seed=seed, fixed_seed=fixed_seed, max_fps=max_fps)
         game.start()
     
     else:
@@ -33,16 +32,33 @@ def main():
         
         if int(input("Perfect information for the agent? (0 for no, 1 for yes)\n")):
             perfect_info = True
+            fov_radius, shadowcasting = 3, False
         else:
             perfect_info = False
+            fov_radius = int(input("How many tiles can the agent see in every direction? (3 by default)\n") or 3)
+            shadowcasting = bool(int(input("Can walls hide tiles behind them? (0 for no, 1 for yes)\n")))
             
-        if int(input("Display game as image or numbers array to agent? (0 for image, 1 for numbers array)\n")):
-            to_image = False
+        display = int(input("Display game as image, numbers array or planes to agent? (0 for image, 1 for numbers array, 2 for planes)\n"))
+        to_image = display == 0
+        planar = display == 2
+        
+        map_size = tuple(int(size) for size in input("How big are levels? (height and width, 15 18 by default)\n").split()) or (15, 18)
+        
+        num_workers = int(input("How many worker processes to run games in? (0 to run in this process)\n"))
+        
+        if num_workers > 0:
+            num_envs = 1
         else:
-            to_image = True
+            num_envs = int(input("How many games to play one after another? (1 for a single game)\n"))
         
-        env = RLEnv(seed=seed, to_image=to_image, fixed_seed=fixed_seed, perfect_info=perfect_info)
-        env = DummyVecEnv([lambda: env])
+        if num_workers > 0:
+            level_pool = None
+        else:
+            pool_workers = int(input("How many processes to pre-generate levels in? (0 to generate them when needed)\n"))
+            level_pool = LevelPool(pool_workers) if pool_workers > 0 else None
+        
+        env = make_env(seed=seed, fixed_seed=fixed_seed, to_image=to_image, perfect_info=perfect_info, planar=planar, num_workers=num_workers,
+                       num_envs=num_envs, map_size=map_size, level_pool=level_pool, fov_radius=fov_radius, shadowcasting=shadowcasting)
         mode = int(input("Create new model or load existing? (0 for new, 1 for load)\n"))
         
         algo_num = int(input("Which algorithm to use? (0 for DQN, 1 for PPO, 2 for A2C)\n"))
@@ -59,14 +75,11 @@ def main():
             model = load_model(algo, path, env)
         
         else:
-            save_path = os.path.join('Environment', 'SavedModels') + "\\"
+            save_path = os.path.join('Environment', 'SavedModels')
             full_path = next_available("", save_path)
 
             timesteps = int(input("Please enter desired training timesteps.\n"))
             
-            if fixed_seed == True:
-                env.env_method("set_seed", seed=seed)
-            
             if int(input("Multi-layer perceptron or convolutional neural network? (0 for mlp, 1 for cnn)\n")):
                 mlp = False
             else:
@@ -1,98 +1,196 @@
 from __future__ import annotations
 
 import numpy as np
-import copy
 
-from typing import Tuple, TYPE_CHECKING
+from typing import NamedTuple, Optional, Tuple, TYPE_CHECKING
 
 import math
-
 import time
-import random
-from src.world.level import Level
+
+from src.world.level import Level, LevelState
 from src.entities.entity import AIFighter, Fighter, Item, Actor
 from src.utilities.actions import Movement, Attack, Take
-from src.utilities.pathfind import get_path_to
-from datetime import datetime
+from src.utilities.pathfind import get_distance_field, get_step_to
+from src.utilities.fov import mark_fov
+from src.world.tile import floor
  
 if TYPE_CHECKING:
     from src.world.tile import Tile
+    from src.world.level_pool import LevelPool
+    from src.utilities.profiler import Profiler
+
+def level_seed(seed: int, depth: int) -> int:
+    """
+    Derives the seed of a level from the game's seed and the level's depth. Every depth gets its own child stream
+    of the game's seed sequence, so levels don't depend on each other and can be generated in any order.
+    """
+    return int(np.random.SeedSequence(seed, spawn_key=(depth,)).generate_state(1, np.uint64)[0])
+
+def generate_level(depth: int, player: Fighter, seed: int, map_size: Tuple[int, int] = (15, 18)) -> Level:
+    """
+    Generates a level for the dungeon by creating a new level completely,
+    carving out its rooms and then spawning its entities. The level only depends on the depth, seed and map size.
+
+    Args:
+        depth (int): Depth of the level, starting from 0.
+        player (Fighter): Player to spawn in the level.
+        seed (int): Seed of the game, the level's own seed is derived from it and the depth.
+        map_size (Tuple[int, int], optional): Height and width of the level. Defaults to (15, 18).
+
+    Returns:
+        Level: The generated level.
+    """
+    return generate_level_from_seed(depth, player, level_seed(seed, depth), map_size)
+
+def generate_level_from_seed(depth: int, player: Fighter, own_seed: int, map_size: Tuple[int, int] = (15, 18)) -> Level:
+    """
+    Generates a level from the level's own seed, as kept in Level.seed, so a level can be generated again
+    without knowing the game it came from.
+
+    Args:
+        depth (int): Depth of the level, starting from 0.
+        player (Fighter): Player to spawn in the level.
+        own_seed (int): The level's own seed.
+        map_size (Tuple[int, int], optional): Height and width of the level. Defaults to (15, 18).
+
+    Returns:
+        Level: The generated level.
+    """
+    height, width = map_size
+    level = Level(height, width, player, own_seed)
+    
+    min_rooms, max_rooms, min_room_size, max_room_size, num_enemies, num_potions = Engine.calculate_paramaters(depth, map_size)
+    
+    level.carve(min_rooms, max_rooms, min_room_size, max_room_size, num_enemies, num_potions)
+    level.spawner(num_enemies, num_potions)
+    return level
  
+class EngineState(NamedTuple):
+    """
+    Copy of a game's state made by Engine.snapshot. The player is kept as x, y, hp, max hp, attack, defense and gold.
+    """
+    level: LevelState
+    player: Tuple[int, int, int, int, int, int, int]
+    depth: int
+    seed: int
+
 class Engine:
 
-    def __init__(self, player: Fighter, seed: int = 0, fixed_seed: bool = False, map_size: Tuple[int, int] = (15, 18)) -> None:
+    def __init__(self, player: Fighter, seed: int = 0, fixed_seed: bool = False, map_size: Tuple[int, int] = (15, 18), level_pool: Optional[LevelPool] = None, fov_radius: int = 3, shadowcasting: bool = False) -> None:
         """
         Engine Class is responsible for generating new levels, calculating field-of-vision, and
         handling enemy turns. Initialises seed (make sure to set fixed_seed to true when doing so.) and stage.
+        Without a fixed seed the game's seed is drawn from the operating system's entropy, so games started
+        at the same time, like those in different worker processes, still get different levels.
 
         Args:
             player (Fighter): Player of the game.
             seed (int, optional): Seed to generate from, passed to level constructor. Defaults to 0.
             fixed_seed (bool, optional): Set to true if seed is used, passed to level constructor. Defaults to False.
+            map_size (Tuple[int, int], optional): Height and width of every level. Defaults to (15, 18).
+            level_pool (Optional[LevelPool], optional): Pool of levels generated ahead in the background. Defaults to generating levels when needed.
+            fov_radius (int, optional): Number of tiles the player sees in every direction. Defaults to 3.
+            shadowcasting (bool, optional): Whether walls hide the tiles behind them from the player. Defaults to False.
         """
         self.depth = 0
         self.player = player
         self.seed = seed
         self.fixed_seed = fixed_seed
+        self.map_size = tuple(map_size)
+        self.level_pool = level_pool
+        self.fov_radius = fov_radius
+        self.shadowcasting = shadowcasting
         if self.fixed_seed == False:
-            self.seed = datetime.now().microsecond + int(time.time())
-            random.seed(datetime.now().microsecond + int(time.time()))
+            self.seed = np.random.SeedSequence().entropy
         self.next_level()
         
             
     def next_level(self) -> None:
         """
-        Generates a new level for the dungeon. This is done by creating a new level completely,
-        and creating the background and layout layers of the map.
+        Moves on to a new level for the dungeon. Levels are generated here unless there is a level pool,
+        in which case a ready level is taken from the pool and given the player.
         """
-        self.seed = self.seed + self.seed      
-        self.level = Level(15, 18, self.player, self.seed, self.fixed_seed)
-        random.seed(datetime.now().microsecond + int(time.time()))
+        if self.level_pool is None:
+            self.level = generate_level(self.depth, self.player, self.seed, self.map_size)
+        else:
+            self.level = self.level_pool.get(self.depth, self.seed if self.fixed_seed else None, self.map_size)
+            self.level.set_player(self.player)
         
-        min_rooms, max_rooms, min_room_size, max_room_size, num_enemies, num_potions = self.calculate_paramaters((15,18))
+        self.depth += 1
+
+    def snapshot(self) -> EngineState:
+        """
+        Copies the full state of the game, its level and random generator, player, depth and seed, so that the game
+        can be put back into it later with Engine.restore, for example to search ahead from a state.
+
+        Returns:
+            EngineState: The game's state.
+        """
+        player = self.player
+        return EngineState(
+            self.level.snapshot(),
+            (player.x, player.y, player.hp, player.max_hp, player.attack, player.defense, player.gold),
+            self.depth,
+            self.seed
+        )
+
+    def restore(self, state: EngineState) -> None:
+        """
+        Puts the game back into a state made by Engine.snapshot. The state is copied into the current level
+        and player, so anything holding on to them stays in sync, and the state can be restored again.
+
+        Args:
+            state (EngineState): The state to restore.
+        """
+        self.level.restore(state.level)
         
-        self.level.carve(min_rooms, max_rooms, min_room_size, max_room_size, num_enemies, num_potions)
-        self.background = copy.deepcopy(self.level)
-        self.layout = copy.deepcopy(self.level)
-        self.level.spawner(num_enemies, num_potions)
-        self.clean_up()
+        player = self.player
+        x, y, player.hp, player.max_hp, player.attack, player.defense, player.gold = state.player
+        player.set_pos(x, y)
+        self.level.player = player
+        self.level.entity_layer[player.pos] = player
         
-        self.depth += 1
+        self.depth = state.depth
+        self.seed = state.seed
 
-    def calculate_paramaters(self, map_size) -> None:
+    @staticmethod
+    def calculate_paramaters(depth: int, map_size: Tuple[int, int]) -> Tuple[int, int, int, int, int, int]:
         """
         Calculates parameters for room and level generation to scale the difficulty with depth.
+        Counts are set for the default 15 by 18 map, and multiplied for every two maps of that size that fit
+        in a bigger one, so big levels are as full of rooms, enemies and potions as small ones, with rooms
+        spread out enough that there is always space left to place them.
         """
-        min_rooms = min(4, 3 + (self.depth-int(self.depth/4)))
-        max_rooms = min(4, 3 + (self.depth - int(self.depth/4)))
+        height, width = map_size
+        scale = max(1, (height*width) // (2 * 15*18))
+        
+        min_rooms = min(4, 3 + (depth-int(depth/4))) * scale
+        max_rooms = min(4, 3 + (depth - int(depth/4))) * scale
         min_room_size = 4
-        max_room_size = min(5, 4 + self.depth-int(self.depth/4))
-        num_enemies = min(6, 2 + (self.depth))
-        num_potions = min(6, 2 + int(self.depth/2))
+        max_room_size = min(5, 4 + depth-int(depth/4))
+        num_enemies = min(6, 2 + (depth)) * scale
+        num_potions = min(6, 2 + int(depth/2)) * scale
         return min_rooms, max_rooms, min_room_size, max_room_size, num_enemies, num_potions
         
-    def clean_up(self) -> None:
-        """
-        Checks if entities exist in their given positions, if not remove them.
-        """
-        entities_clean = copy.copy(self.level.entities)
-        for entity in entities_clean:
-            if isinstance(self.level.tiles[entity.pos[0], entity.pos[1]], AIFighter):
-                continue
-            else:
-                self.level.entities.remove(entity)
-    
     def handle_enemy_turns(self) -> None:
         """
         Handles enemies turns by looping over all enemies in previously explored tiles and sending
-        them on a path to the player. When player is dead return because game is over.
-        """
-        enemies = copy.deepcopy(self.level.entities)
-        for entity in enemies:
-            if isinstance(entity, AIFighter) and self.layout.tiles[entity.pos].explored:
-                path = get_path_to(entity, self.player.pos, self.level)
-                path = (path[1] - entity.pos[0], path[0] - entity.pos[1])
-                self.bump(entity.pos, path)
+        them on a path to the player. All enemies follow one distance field to the player, calculated
+        once per turn only as far out as the enemies that move. When player is dead return because game is over.
+        """
+        explored = self.level.explored
+        moving = [enemy.pos for enemy in self.level.enemies.values() if explored[enemy.pos]]
+        if not moving:
+            return
+        
+        field = get_distance_field(self.level, self.player.pos, moving)
+        for enemy_id in list(self.level.enemies):
+            entity = self.level.enemies.get(enemy_id)
+            if entity is not None and explored[entity.pos]:
+                step = get_step_to(entity, field)
+                if step == (0,0):
+                    continue
+                self.bump(entity.pos, step)
                 if self.player.is_dead():
                     return
 
@@ -108,10 +206,9 @@ class Engine:
             Tuple[type, (Fighter | Item | Tile)]: A tuple including type of action taken and what was on the destination tile.
         """
         # Grabs entity to_move and whatever is on the destination tile.
-        to_move = self.level.tiles[start]
+        to_move = self.level.entity_at(start)
         change_x, change_y = change
-        dest = self.level.tiles[start[0]+change_x, start[1]+change_y]
-        dest_bg = self.layout.tiles[start[0]+change_x, start[1]+change_y]
+        dest = self.level.tile_at((start[0]+change_x, start[1]+change_y))
         
         # Makes enemies not attack each other.
         if isinstance(dest, AIFighter) and isinstance(to_move, AIFighter):
@@ -122,25 +219,25 @@ class Engine:
             action = Attack(self)
                     
         # Otherwise, checks if item is ahead
-        elif (isinstance(dest, Item) or isinstance(dest_bg,Item)) and isinstance(to_move, Fighter):
+        elif isinstance(dest, Item) and isinstance(to_move, Fighter):
             action = Take(self)
         
         else:
             action = Movement(self)
         
-        destc = copy.deepcopy(dest)
-        
         action.perform(start, change)
         return type(action), dest
         
-    def fov(self) -> None:
+    def fov(self) -> int:
         """
-        Calculates player's field of vision by marking 3 tiles to the right, top, buttom, and left as explored.
+        Calculates player's field of vision by marking the tiles within fov_radius of the player as explored,
+        leaving out tiles hidden behind walls when shadowcasting.
+
+        Returns:
+            int: Number of floor tiles seen for the first time, only counted within the field of vision.
         """
-        
-        for y in range(max(0,self.player.pos[1]-3), min(self.level.height, self.player.pos[1]+3)):
-            for x in range(max(0,self.player.pos[0]-3), min(self.level.width, self.player.pos[0]+3)):
-                self.layout.tiles[x,y].explored = True
+        on_map, newly_explored = mark_fov(self.level.explored, self.level.see_through, self.player.pos, self.fov_radius, self.shadowcasting)
+        return int(np.count_nonzero(newly_explored & (self.level.terrain[on_map] == floor.code)))
                 
     def render(self) -> None:
         """
@@ -149,8 +246,8 @@ class Engine:
         self.fov()
         for y in range(self.level.height):
             for x in range(self.level.width):
-                if self.layout.tiles[x,y].explored:
-                    print(self.level.tiles[x,y].char, end="  ")
+                if self.level.explored[x,y]:
+                    print(self.level.char_at((x,y)), end="  ")
                 else:
                     print("   ", end="")
             print("\n")
@@ -162,7 +259,49 @@ class Engine:
         Cheats used for debugging.
         """
         if cheat == "godmode":
-            for y in range(self.level.height):
-                for x in range(self.level.width):
-                    self.layout.tiles[x,y].explored = True
-            self.player.hp = 5000
\ No newline at end of file
+            self.level.explored[:] = True
+            self.player.hp = 5000
+
+class ProfiledEngine(Engine):
+
+    def __init__(self, profiler: Profiler, *args, **kwargs) -> None:
+        """
+        Engine that records how long each phase of a turn takes. Used in place of Engine only when profiling,
+        so that the engine itself has no timing code. Enemies' turns are split into pathfinding and action
+        resolution by timing their bumps, and the player's own bump is recorded on its own.
+
+        Args:
+            profiler (Profiler): Profiler to record times in.
+            *args, **kwargs: Passed on to Engine.
+        """
+        self.profiler = profiler
+        self.enemy_turn = False
+        self.enemy_actions = 0.0
+        super().__init__(*args, **kwargs)
+
+    def fov(self) -> int:
+        start = time.perf_counter()
+        newly_explored = super().fov()
+        self.profiler.record("fov", time.perf_counter() - start)
+        return newly_explored
+
+    def bump(self, start: Tuple[int, int], change: Tuple[(1 | 0), (1 | 0)]) -> Tuple[type, (Fighter | Item | Tile)]:
+        began = time.perf_counter()
+        result = super().bump(start, change)
+        elapsed = time.perf_counter() - began
+        if self.enemy_turn:
+            self.enemy_actions += elapsed
+            self.profiler.record("enemy_actions", elapsed)
+        else:
+            self.profiler.record("bump", elapsed)
+        return result
+
+    def handle_enemy_turns(self) -> None:
+        self.enemy_turn = True
+        self.enemy_actions = 0.0
+        start = time.perf_counter()
+        super().handle_enemy_turns()
+        elapsed = time.perf_counter() - start
+        self.enemy_turn = False
+        self.profiler.record("enemy_turns", elapsed)
+        self.profiler.record("enemy_pathfinding", elapsed - self.enemy_actions)
@@ -9,6 +9,13 @@ class Entity():
         self.name = name
         self.char = char
         self.blocks_movement = blocks_movement
+        self.id = None # Given by the level the entity is placed in.
+    
+    def __copy__(self) -> Entity:
+        # Entities only hold plain values, so copying the attributes is enough and much faster than the default.
+        entity = object.__new__(type(self))
+        entity.__dict__.update(self.__dict__)
+        return entity
     
     @property
     def pos(self) -> Tuple[int, int]:
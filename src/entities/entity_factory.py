@@ -1,8 +1,5 @@
 import copy
-from src.entities.entity import Entity, Fighter, AIFighter, Potion, Exit
-
-# Corpse
-corpse = Entity(name="corpse", char="q", blocks_movement=False)
+from src.entities.entity import Fighter, AIFighter, Potion, Exit
 
 # Player
 player = Fighter(name="player", char="@", blocks_movement=True, hp=20, attack=5, defense=2)
@@ -13,4 +10,8 @@ vampire = AIFighter(name="vampire", char="v", blocks_movement=True, hp=12, attac
 
 # Items
 exit = Exit(name="exit", char=">", blocks_movement=False)
-health_potion = Potion(name="health potion", char="+", blocks_movement=False, hp=10)
\ No newline at end of file
+health_potion = Potion(name="health potion", char="+", blocks_movement=False, hp=10)
+
+# Every kind of entity, looked up by name when a level's entities are stored in arrays.
+templates = (player, zombie, vampire, exit, health_potion)
+template_codes = {template.name: code for code, template in enumerate(templates)}
@@ -2,32 +2,39 @@ import copy
 
 from pynput.keyboard import Listener
 
+from typing import Optional
+
 from src.utilities.input import InputHandler
+from src.utilities.terminal import TerminalRenderer
 from src.engine import Engine
 from src.entities.entity_factory import player
 
 
 class Game:
-    def __init__(self, seed: int = 0, fixed_seed: bool = False) -> None:
+    def __init__(self, seed: int = 0, fixed_seed: bool = False, max_fps: Optional[float] = None) -> None:
         """
         Game class handles running the game from main.py
 
         Args:
             seed (int, optional): The seed for the level generation. Defaults to 0.
             fixed_seed (bool, optional): Set to true if you want to use a seed. Defaults to False.
+            max_fps (Optional[float], optional): Most frames drawn a second. Defaults to no limit.
         """
         self.player = copy.deepcopy(player)
         self.engine = Engine(self.player, seed, fixed_seed)
+        self.renderer = TerminalRenderer(max_fps=max_fps)
     
     def start(self) -> None:
         """
-        Starts the game by creating an input handler and performing a game loop.
+        Starts the game by creating an input handler and performing a game loop, drawing only what changed every turn.
         """
         self.input_handler = InputHandler(game=self)
         while not self.engine.player.is_dead():
-            self.engine.render()
+            self.engine.fov()
+            self.renderer.draw(self.engine.level, self.engine.player)
             self.input_handler.parse()
             self.engine.handle_enemy_turns()
+        self.renderer.close()
         print("You fought well, but you suck.")
     
     def quit(self) -> None:
@@ -55,4 +62,5 @@ class Game:
         with Listener(
             on_press=self.on_press,
             ) as listener:
-            listener.join()
\ No newline at end of file
+            listener.join()
+        self.renderer.invalidate()
\ No newline at end of file
@@ -1,10 +1,8 @@
 from __future__ import annotations
 
 from typing import Tuple, TYPE_CHECKING
-import copy
 
-from src.world.tile import floor
-from src.entities.entity_factory import corpse
+from src.world.tile import floor, corpse
 
 if TYPE_CHECKING:
     from src.engine import Engine
@@ -37,35 +35,33 @@ class Movement(Action):
         super().__init__(engine)
     
     def perform(self, start, change):
-        to_move = self.engine.level.tiles[start]
+        to_move = self.engine.level.entity_at(start)
         change_x, change_y = change
-        dest = self.engine.level.tiles[start[0]+change_x, start[1]+change_y]
+        dest = self.engine.level.tile_at((start[0]+change_x, start[1]+change_y))
         
         # If movement is blocked don't move and waste a turn.
         if dest.blocks_movement:
             return
         
-        to_move.move(change_x, change_y)
-        self.engine.level.tiles[start] = self.engine.background.tiles[start]
-        self.engine.level.tiles[to_move.pos] = to_move
+        self.engine.level.move(to_move, change_x, change_y)
 
 class Attack(Action):
     def __init__(self, engine):
         super().__init__(engine)
     
     def perform(self, start, change):
-        to_move = self.engine.level.tiles[start]
+        to_move = self.engine.level.entity_at(start)
         change_x, change_y = change
-        dest = self.engine.level.tiles[start[0]+change_x, start[1]+change_y]
+        dest = self.engine.level.entity_at((start[0]+change_x, start[1]+change_y))
         
         # Attacks character in destination tile
         dest.damage(to_move.attack)
         if dest.is_dead():
-            try:
-                self.engine.level.entities.remove(dest)
-            except KeyError:
+            # The player's body stays where it fell.
+            if dest is self.engine.player:
                 return
-            self.engine.level.tiles[start[0]+change_x, start[1]+change_y], self.engine.background.tiles[start[0]+change_x, start[1]+change_y] = copy.deepcopy(corpse), copy.deepcopy(corpse)
+            self.engine.level.remove(dest.pos)
+            self.engine.level.set_terrain(dest.pos, corpse)
             if to_move == self.engine.player:
                 if dest.char == "z":
                     self.engine.player.gold += 1
@@ -77,11 +73,11 @@ class Take(Action):
         super().__init__(engine)
     
     def perform(self, start, change):
-        to_move = self.engine.level.tiles[start]
         change_x, change_y = change
-        dest = self.engine.level.tiles[start[0]+change_x, start[1]+change_y]
+        dest = self.engine.level.entity_at((start[0]+change_x, start[1]+change_y))
         
-        self.engine.level.tiles[start[0]+change_x, start[1]+change_y], self.engine.background.tiles[start[0]+change_x, start[1]+change_y] = copy.deepcopy(floor), copy.deepcopy(floor)
+        self.engine.level.remove(dest.pos)
+        self.engine.level.set_terrain(dest.pos, floor)
         dest.perform(self.engine)
         
         
\ No newline at end of file
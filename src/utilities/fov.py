@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import numpy as np
+
+from typing import Dict, List, Tuple
+
+# Multipliers turning the first octant into each of the eight, as xx, xy, yx and yy.
+octants = (
+    (1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+    (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1)
+)
+
+# Cells of each row of each octant with their slopes, by radius, and the visible masks already cast, by radius and window.
+shadow_tables: Dict[int, List[List[List[Tuple[int, float, float]]]]] = {}
+shadow_masks: Dict[Tuple[int, bytes], np.ndarray] = {}
+
+# The masks are thrown out once they take more than this many bytes, counting each one's key, mask and bookkeeping,
+# so that larger radii, whose windows are bigger and far more varied, keep fewer masks in the same memory.
+max_shadow_mask_bytes = 32 * 2**20
+shadow_mask_overhead = 384
+shadow_mask_bytes = 0
+
+def get_window(pos: Tuple[int, int], radius: int, shape: Tuple[int, int]) -> Tuple[Tuple[slice, slice], Tuple[slice, slice]]:
+    """
+    Gets the square window of cells within a radius of a position, cut off at the edges of the map.
+
+    Args:
+        pos (Tuple[int, int]): Centre of the window.
+        radius (int): Number of cells the window reaches out from its centre.
+        shape (Tuple[int, int]): Width and height of the map.
+
+    Returns:
+        Tuple[Tuple[slice, slice], Tuple[slice, slice]]: Slices of the window on the map, and the same cells on a full window.
+    """
+    x, y = pos
+    x0, x1 = max(0, x - radius), min(shape[0], x + radius + 1)
+    y0, y1 = max(0, y - radius), min(shape[1], y + radius + 1)
+    on_map = (slice(x0, x1), slice(y0, y1))
+    on_window = (slice(x0 - x + radius, x1 - x + radius), slice(y0 - y + radius, y1 - y + radius))
+    return on_map, on_window
+
+def get_shadow_table(radius: int) -> List[List[List[Tuple[int, float, float]]]]:
+    """
+    Precomputes the rows of every octant for shadowcasting within a radius. Each cell is kept as its flat index
+    in the window along with the slopes of its left and right edges, so casting only has to look them up.
+
+    Args:
+        radius (int): Number of cells the field of view reaches.
+
+    Returns:
+        List[List[List[Tuple[int, float, float]]]]: Cells of each row, starting one cell away from the centre, for each octant.
+    """
+    if radius in shadow_tables:
+        return shadow_tables[radius]
+
+    size = 2*radius + 1
+    table = []
+    for xx, xy, yx, yy in octants:
+        rows = []
+        for row in range(1, radius + 1):
+            cells = []
+            for dx in range(-row, 1):
+                dy = -row
+                x = radius + dx*xx + dy*xy
+                y = radius + dx*yx + dy*yy
+                cells.append((x*size + y, (dx - 0.5) / (dy + 0.5), (dx + 0.5) / (dy - 0.5)))
+            rows.append(cells)
+        table.append(rows)
+    shadow_tables[radius] = table
+    return table
+
+def cast_light(rows: List[List[Tuple[int, float, float]]], opaque: np.ndarray, visible: np.ndarray, row: int, start: float, end: float) -> None:
+    """
+    Recursively casts light through one octant between two slopes, splitting the light around opaque cells.
+
+    Args:
+        rows (List[List[Tuple[int, float, float]]]): The octant's rows from get_shadow_table.
+        opaque (np.ndarray): Flat mask of the window's cells that block sight.
+        visible (np.ndarray): Flat mask of the window's cells seen so far, marked in place.
+        row (int): Row to start at, counting from one.
+        start (float): Slope the light starts at.
+        end (float): Slope the light ends at.
+    """
+    if start < end:
+        return
+    new_start = start
+    for row_idx in range(row - 1, len(rows)):
+        blocked = False
+        for index, left_slope, right_slope in rows[row_idx]:
+            if start < right_slope:
+                continue
+            if end > left_slope:
+                break
+
+            visible[index] = True
+            if blocked:
+                if opaque[index]:
+                    new_start = right_slope
+                else:
+                    blocked = False
+                    start = new_start
+            elif opaque[index] and row_idx + 1 < len(rows):
+                blocked = True
+                cast_light(rows, opaque, visible, row_idx + 2, start, left_slope)
+                new_start = right_slope
+        if blocked:
+            break
+
+def get_shadow_mask(see_through: np.ndarray, pos: Tuple[int, int], radius: int) -> np.ndarray:
+    """
+    Gets the cells seen from a position by recursive shadowcasting. Masks are kept by the window's
+    see through cells, since the same windows come up again and again.
+
+    Args:
+        see_through (np.ndarray): Mask of cells that can be seen through, indexed by [x, y].
+        pos (Tuple[int, int]): Position seen from.
+        radius (int): Number of cells the field of view reaches.
+
+    Returns:
+        np.ndarray: Mask of the visible cells in the full window around the position, which must not be modified.
+    """
+    size = 2*radius + 1
+    on_map, on_window = get_window(pos, radius, see_through.shape)
+
+    # Cells off the map block sight.
+    window = np.zeros((size, size), dtype=bool)
+    window[on_window] = see_through[on_map]
+    key = (radius, window.tobytes())
+    if key in shadow_masks:
+        return shadow_masks[key]
+
+    opaque = ~window.ravel()
+    visible = np.zeros(size*size, dtype=bool)
+    visible[radius*size + radius] = True
+    for rows in get_shadow_table(radius):
+        cast_light(rows, opaque, visible, 1, 1.0, 0.0)
+
+    global shadow_mask_bytes
+    entry_bytes = 2*size*size + shadow_mask_overhead
+    if shadow_mask_bytes + entry_bytes > max_shadow_mask_bytes:
+        shadow_masks.clear()
+        shadow_mask_bytes = 0
+    shadow_mask_bytes += entry_bytes
+    mask = shadow_masks[key] = visible.reshape(size, size)
+    return mask
+
+def mark_fov(explored: np.ndarray, see_through: np.ndarray, pos: Tuple[int, int], radius: int = 3, shadowcasting: bool = False) -> Tuple[Tuple[slice, slice], np.ndarray]:
+    """
+    Marks the cells seen from a position as explored, with one array operation over the window around it.
+    Without shadowcasting every cell in the window is seen, walls or not.
+
+    Args:
+        explored (np.ndarray): Explored mask, indexed by [x, y], marked in place.
+        see_through (np.ndarray): Mask of cells that can be seen through, indexed by [x, y].
+        pos (Tuple[int, int]): Position seen from.
+        radius (int, optional): Number of cells the field of view reaches. Defaults to 3.
+        shadowcasting (bool, optional): Whether walls hide the cells behind them. Defaults to False.
+
+    Returns:
+        Tuple[Tuple[slice, slice], np.ndarray]: Slices of the window on the map, and the mask of cells in it seen for the first time.
+    """
+    on_map, on_window = get_window(pos, radius, explored.shape)
+    if shadowcasting:
+        newly_explored = get_shadow_mask(see_through, pos, radius)[on_window] & ~explored[on_map]
+    else:
+        newly_explored = ~explored[on_map]
+    explored[on_map] |= newly_explored
+    return on_map, newly_explored
@@ -2,40 +2,60 @@ from __future__ import annotations
 
 import numpy as np
 
-from typing import List, TYPE_CHECKING, Tuple
+from math import inf
+from typing import Iterable, List, TYPE_CHECKING, Tuple
 
 from pathfinding.core.diagonal_movement import DiagonalMovement
 from pathfinding.core.grid import Grid
 from pathfinding.finder.a_star import AStarFinder
 
-from src.entities.entity import Actor, Item
+from src.world.tile import glyphs
 
 if TYPE_CHECKING:
+    from src.entities.entity import Actor, Item
     from src.world.level import Level
 
-def get_cost(level: Level) -> List[List[int]]:
+# Cost of walking over each glyph, items cost the most, then actors, and walls are unwalkable.
+glyph_costs = {
+    "#": 0,
+    ".": 1,
+    "-": 1,
+    "q": 1,
+    "@": 5,
+    "z": 5,
+    "v": 5,
+    "+": 8,
+    ">": 8,
+    " ": 0
+}
+cost_table = np.array([glyph_costs[char] for char in glyphs]) # Indexed by glyph code.
+
+def get_cost(level: Level) -> np.ndarray:
     """
-    Calculates cost of each tile on the level to give a general sense
-    of cost around the stage for pathfinding.
+    Gets cost of each tile on the level to give a general sense
+    of cost around the stage for pathfinding. The level keeps it up to date, so it must not be modified.
     
     Args:
         level (Level): Passed through to get information on tiles.
 
     Returns:
-        List[List[int]]: A 2D array of integers representing the map
+        np.ndarray: A 2D array of integers representing the map
     """
-    cost = np.array([[0]*level.height]*level.width)
-    for y in range(level.height):
-        for x in range(level.width):
-            if level.tiles[x,y].char == ">" or level.tiles[x,y].char == "+":
-                cost[x,y] = 8
-            elif isinstance(level.tiles[x,y], Actor):
-                cost[x,y] = 5
-            elif level.tiles[x,y].blocks_movement:
-                continue
-            else:
-                cost[x,y] = 1
-    return cost
+    return level.cost
+
+def get_cache(level: Level) -> dict:
+    """
+    Gets pathfinding structures built from the level's costs, emptied whenever the level has changed since they were built.
+    
+    Args:
+        level (Level): The level the structures belong to.
+
+    Returns:
+        dict: The level's pathfinding cache.
+    """
+    if level.path_cache.get("version") != level.version:
+        level.path_cache = {"version": level.version, "fields": {}}
+    return level.path_cache
     
 def get_path_to(entity: Actor, goal: Actor or Item, level: Level) -> Tuple[int, int]:
     """
@@ -49,8 +69,12 @@ def get_path_to(entity: Actor, goal: Actor or Item, level: Level) -> Tuple[int,
     Returns:
         Tuple[int, int]: Returns the next coordinate to go to.
     """
-    cost = get_cost(level)
-    grid = Grid(matrix=cost)
+    cache = get_cache(level)
+    if "grid" in cache:
+        grid = cache["grid"]
+        grid.cleanup()
+    else:
+        grid = cache["grid"] = Grid(matrix=get_cost(level))
         
     start = grid.node(entity.pos[1], entity.pos[0])
     end = grid.node(goal[1], goal[0])
@@ -61,4 +85,75 @@ def get_path_to(entity: Actor, goal: Actor or Item, level: Level) -> Tuple[int,
     try:
         return path[1]
     except IndexError:
-        return (0,0)
\ No newline at end of file
+        return (0,0)
+
+def get_distance_field(level: Level, goal: Tuple[int, int], targets: Iterable[Tuple[int, int]] = ()) -> np.ndarray:
+    """
+    Calculates the cheapest cost of reaching the goal by stepping onto each tile, spreading out from the goal
+    in order of cost. Uses the same costs as get_cost, so following the field walks the same cheapest paths
+    as get_path_to, and one field serves every entity heading to the same goal.
+    Given targets, it stops once their costs are known, so the work grows with how far away they are rather
+    than with the size of the map. The cheapest neighbours of the targets are always known by then, and other
+    tiles may be left too high, which doesn't change the steps taken by get_step_to from the targets.
+
+    Args:
+        level (Level): Passed through to get information on tiles.
+        goal (Tuple[int, int]): Position to reach.
+        targets (Iterable[Tuple[int, int]], optional): Positions the field is needed for. Defaults to every tile.
+
+    Returns:
+        np.ndarray: A 2D array of costs indexed by [x, y], infinite where the goal can't be reached.
+    """
+    cache = get_cache(level)
+    if tuple(goal) in cache["fields"]:
+        return cache["fields"][tuple(goal)]
+    
+    # Walls around the map, so neighbours never need checking against its edges.
+    cost = np.pad(get_cost(level), 1)
+    width, height = cost.shape
+    weight = cost.ravel().tolist()
+    field = [inf] * (width*height)
+    remaining = {(x + 1)*height + y + 1 for x, y in targets}
+    complete = not remaining
+    
+    # Costs are small integers, so tiles waiting to be settled are bucketed by cost instead of kept in a heap.
+    start = (goal[0] + 1)*height + goal[1] + 1
+    distance = field[start] = weight[start]
+    buckets = {distance: [start]}
+    waiting = 1
+    while waiting and (complete or remaining):
+        for index in buckets.pop(distance, ()):
+            waiting -= 1
+            if field[index] != distance:
+                continue
+            remaining.discard(index)
+            for neighbour in (index - height, index + 1, index + height, index - 1):
+                if weight[neighbour] and distance + weight[neighbour] < field[neighbour]:
+                    field[neighbour] = distance + weight[neighbour]
+                    buckets.setdefault(field[neighbour], []).append(neighbour)
+                    waiting += 1
+        distance += 1
+    
+    field = np.array(field).reshape(width, height)[1:-1, 1:-1]
+    if complete:
+        cache["fields"][tuple(goal)] = field
+    return field
+
+def get_step_to(entity: Actor, field: np.ndarray) -> Tuple[int, int]:
+    """
+    Gets the next step of an entity following a distance field down to its goal.
+
+    Args:
+        entity (Actor): The entity searching for the goal.
+        field (np.ndarray): Distance field from get_distance_field.
+
+    Returns:
+        Tuple[int, int]: Change in x and y to the cheapest neighbouring tile, (0,0) if the goal can't be reached.
+    """
+    x, y = entity.pos
+    best, step = np.inf, (0,0)
+    for change_x, change_y in ((-1,0), (0,1), (1,0), (0,-1)):
+        if 0 <= x + change_x < field.shape[0] and 0 <= y + change_y < field.shape[1]:
+            if field[x + change_x, y + change_y] < best:
+                best, step = field[x + change_x, y + change_y], (change_x, change_y)
+    return step
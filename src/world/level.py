@@ -3,23 +3,74 @@ from __future__ import annotations
 import numpy as np
 import random
 import copy
-from datetime import datetime
 
-from typing import List, TYPE_CHECKING, Tuple
+from typing import Dict, List, NamedTuple, Optional, TYPE_CHECKING, Tuple
 
-from src.world.tile import wall, floor
+from src.world.tile import Tile, wall, floor, glyphs, glyph_codes, tile_types
 from src.world.room import RectangleRoom
-from src.entities.entity_factory import zombie, vampire, exit, health_potion
+from src.entities.entity_factory import zombie, vampire, exit, health_potion, templates, template_codes
+from src.utilities.pathfind import cost_table
+
+from src.entities.entity import AIFighter, Item
 
 if TYPE_CHECKING:
-    from src.entities.entity import Fighter
+    from src.entities.entity import Entity, Fighter
+
+class LevelState(NamedTuple):
+    """
+    Copy of a level's state kept in arrays, made by Level.snapshot. Entities other than the player are rows of
+    kind, id, x, y, hp, attack and defense, enemies first and then items, each in the order they were placed in.
+    Rooms are shared with the level, since they don't change once carved.
+    """
+    terrain: np.ndarray
+    glyphs: np.ndarray
+    blocks_movement: np.ndarray
+    see_through: np.ndarray
+    explored: np.ndarray
+    cost: np.ndarray
+    entities: np.ndarray
+    num_enemies: int
+    next_id: int
+    seed: int
+    random_state: tuple
+    rooms: List[RectangleRoom]
+
+# Random spots tried for a room before it is placed from the free spots left.
+placement_attempts = 16
+
+def get_free_corners(taken: np.ndarray, width: int, height: int) -> np.ndarray:
+    """
+    Finds every spot a room fits in without touching taken cells, counting the taken cells under every spot at once
+    from a summed area table of the map.
+
+    Args:
+        taken (np.ndarray): Mask of cells taken by rooms, walls included, indexed by [x, y].
+        width (int): Width of the room.
+        height (int): Height of the room.
+
+    Returns:
+        np.ndarray: The x1 and y1 of every free spot, in order, one spot a row.
+    """
+    map_width, map_height = taken.shape
+    sums = np.zeros((map_width + 1, map_height + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(taken, axis=0), axis=1, out=sums[1:, 1:])
+    
+    # Rooms cover width + 1 by height + 1 cells and are kept off the last row and column, like in Level.carve.
+    spots_x, spots_y = map_width - width, map_height - height
+    counts = (sums[width + 1:width + 1 + spots_x, height + 1:height + 1 + spots_y] - sums[:spots_x, height + 1:height + 1 + spots_y]
+              - sums[width + 1:width + 1 + spots_x, :spots_y] + sums[:spots_x, :spots_y])
+    return np.argwhere(counts == 0)
 
 class Level:
 
-    def __init__(self, height: int, width: int, player: Fighter, seed: int = 0, fixed_seed: bool = False) -> None:
+    def __init__(self, height: int, width: int, player: Fighter, seed: int = 0) -> None:
         """
         Initialises level by taking the height and width of the desired map (usually fixed for the agent's observation space), 
-        the game's player, and a seed if desired. To use the seed please set fixed_seed to True.
+        the game's player, and the seed of the level. The level draws from its own random generator seeded with it,
+        so the same seed always carves and fills the same level, and levels can be generated in parallel.
+        
+        The map is stored as a set of arrays indexed by [x, y]. The terrain layer holds the glyph codes of the tiles,
+        the entity layer holds only actors and items by position, and the glyphs array is both layers drawn together.
         
         To-Do?:
             - Remove tether to agent's observation space by setting a max size that we can cut out of.
@@ -29,24 +80,190 @@ class Level:
             width (int): Width for console view.
             player (Player): Player of the game.
             seed (int): Seed to randomise with.
-            fixed_seed (bool, optional): If you want to use a specific seed, this must be set true. Defaults to False.
         """
         self.player = player
         self.height = height
         self.width = width
-        self.tiles = np.array([[wall]*height]*width)
-        for y in range(height):
-            for x in range(width):
-                self.tiles[x,y] = copy.deepcopy(wall)
-        self.entities = set([self.player])
-        
-        if fixed_seed:
-            self.seed = seed
-            random.seed(self.seed)
-        else:
-            random.seed(datetime.now().microsecond)
-            self.seed = seed
-        self.seedings = 0
+        
+        self.terrain = np.full((width, height), wall.code, dtype=np.uint8)
+        self.glyphs = np.full((width, height), wall.code, dtype=np.uint8)
+        self.blocks_movement = np.full((width, height), wall.blocks_movement, dtype=bool)
+        self.see_through = np.full((width, height), wall.see_through, dtype=bool)
+        self.explored = np.zeros((width, height), dtype=bool)
+        
+        # Pathfinding cost of every cell, kept up to date as the glyphs change. The version counts changes
+        # so that pathfinding structures built from the costs are reused until the level changes.
+        self.cost = np.full((width, height), cost_table[wall.code], dtype=int)
+        self.version = 0
+        self.path_cache = {}
+        
+        # Registry of entities by position and by kind, kept up to date as entities are placed, moved and removed.
+        # Enemies and items are keyed by ids given out by the level, and kept in the order they were placed in.
+        self.entity_layer: Dict[Tuple[int, int], Entity] = {}
+        self.enemies: Dict[int, AIFighter] = {}
+        self.items: Dict[int, Item] = {}
+        self.next_id = 0
+        
+        self.seed = seed
+        self.random = random.Random(seed)
+
+    def set_terrain(self, space: Tuple[(int | slice), (int | slice)], tile: Tile) -> None:
+        """
+        Sets the terrain of a cell or a slice of cells to a tile. Should only be used on cells without entities.
+
+        Args:
+            space (Tuple[(int | slice), (int | slice)]): Position or slices of the cells to set.
+            tile (Tile): The tile to set them to.
+        """
+        self.terrain[space] = tile.code
+        self.draw(space, tile.code)
+        self.blocks_movement[space] = tile.blocks_movement
+        self.see_through[space] = tile.see_through
+
+    def draw(self, space: Tuple[(int | slice), (int | slice)], code: int) -> None:
+        """
+        Draws a glyph code on a cell or a slice of cells, updating their pathfinding cost along with it.
+        """
+        self.glyphs[space] = code
+        self.cost[space] = cost_table[code]
+        self.version += 1
+
+    def entity_at(self, pos: Tuple[int, int]) -> Optional[Entity]:
+        """
+        Gets the actor or item at a position, if there is one.
+        """
+        return self.entity_layer.get(tuple(pos))
+
+    def tile_at(self, pos: Tuple[int, int]) -> (Entity | Tile):
+        """
+        Gets whatever is drawn at a position, the entity if there is one or the terrain's tile otherwise.
+        """
+        entity = self.entity_layer.get(tuple(pos))
+        if entity is None:
+            return tile_types[self.terrain[pos]]
+        return entity
+
+    def char_at(self, pos: Tuple[int, int]) -> str:
+        """
+        Gets the character drawn at a position.
+        """
+        return glyphs[self.glyphs[pos]]
+
+    def register(self, entity: Entity) -> None:
+        """
+        Adds an entity to the registry of its kind.
+        """
+        entity.id = self.next_id
+        self.next_id += 1
+        if isinstance(entity, AIFighter):
+            self.enemies[entity.id] = entity
+        elif isinstance(entity, Item):
+            self.items[entity.id] = entity
+
+    def unregister(self, entity: Entity) -> None:
+        """
+        Removes an entity from the registry of its kind.
+        """
+        self.enemies.pop(entity.id, None)
+        self.items.pop(entity.id, None)
+
+    def place(self, entity: Entity, pos: Tuple[int, int]) -> None:
+        """
+        Places an entity on the entity layer, replacing anything already there.
+        """
+        replaced = self.entity_layer.get(tuple(pos))
+        if replaced is not None:
+            self.unregister(replaced)
+        entity.set_pos(pos[0], pos[1])
+        self.entity_layer[entity.pos] = entity
+        self.register(entity)
+        self.draw(entity.pos, glyph_codes[entity.char])
+
+    def remove(self, pos: Tuple[int, int]) -> None:
+        """
+        Removes the entity at a position from the entity layer, uncovering the terrain below it.
+        """
+        self.unregister(self.entity_layer.pop(tuple(pos)))
+        self.draw(pos, self.terrain[pos])
+
+    def move(self, entity: Entity, change_x: int, change_y: int) -> None:
+        """
+        Moves an entity on the entity layer, replacing anything at its destination.
+        """
+        del self.entity_layer[entity.pos]
+        self.draw(entity.pos, self.terrain[entity.pos])
+        entity.move(change_x, change_y)
+        
+        replaced = self.entity_layer.get(entity.pos)
+        if replaced is not None:
+            self.unregister(replaced)
+        self.entity_layer[entity.pos] = entity
+        self.draw(entity.pos, glyph_codes[entity.char])
+
+    def set_player(self, player: Fighter) -> None:
+        """
+        Puts a different player object in the place of the level's player, for levels generated away from the game.
+        """
+        pos = self.player.pos
+        self.player = player
+        self.place(player, pos)
+
+    def snapshot(self) -> LevelState:
+        """
+        Copies the level's state into arrays, which is much faster than deep copying the level.
+        The player is left out, as it belongs to the engine.
+
+        Returns:
+            LevelState: The level's state.
+        """
+        entities = np.zeros((len(self.enemies) + len(self.items), 7), dtype=np.int32)
+        for row, entity in enumerate(list(self.enemies.values()) + list(self.items.values())):
+            entities[row, :4] = template_codes[entity.name], entity.id, entity.x, entity.y
+            if isinstance(entity, AIFighter):
+                entities[row, 4:] = entity.hp, entity.attack, entity.defense
+        
+        return LevelState(
+            self.terrain.copy(), self.glyphs.copy(), self.blocks_movement.copy(), self.see_through.copy(),
+            self.explored.copy(), self.cost.copy(),
+            entities, len(self.enemies), self.next_id, self.seed, self.random.getstate(), getattr(self, "rooms", [])
+        )
+
+    def restore(self, state: LevelState) -> None:
+        """
+        Puts the level back into a state made by Level.snapshot, of this level or another one of the same size.
+        The player is placed back by the engine.
+
+        Args:
+            state (LevelState): The state to restore.
+        """
+        np.copyto(self.terrain, state.terrain)
+        np.copyto(self.glyphs, state.glyphs)
+        np.copyto(self.blocks_movement, state.blocks_movement)
+        np.copyto(self.see_through, state.see_through)
+        np.copyto(self.explored, state.explored)
+        np.copyto(self.cost, state.cost)
+        
+        # The costs may have changed without going through draw, so pathfinding caches are thrown out.
+        self.version += 1
+        
+        self.entity_layer = {}
+        self.enemies = {}
+        self.items = {}
+        for row, (kind, entity_id, x, y, hp, attack, defense) in enumerate(state.entities.tolist()):
+            entity = copy.copy(templates[kind])
+            entity.id = entity_id
+            entity.set_pos(x, y)
+            if row < state.num_enemies:
+                entity.hp, entity.attack, entity.defense = hp, attack, defense
+                self.enemies[entity_id] = entity
+            else:
+                self.items[entity_id] = entity
+            self.entity_layer[entity.pos] = entity
+        
+        self.next_id = state.next_id
+        self.seed = state.seed
+        self.random.setstate(state.random_state)
+        self.rooms = state.rooms
 
     def tunnel(self, currRoom: RectangleRoom) -> None:
         """
@@ -61,32 +278,20 @@ class Level:
 
             prev_x, prev_y = self.rooms[len(self.rooms)-1].center
 
-            # We give the tunnel a 50% chance to start horizontally
-            if random.randint(0,1) == 1:
-                for x in range(min(prev_x, curr_x), max(prev_x, curr_x) + 1):
-                    self.tiles[x, prev_y] = copy.deepcopy(floor)
-                    """if self.tiles[x, prev_y-1].char == "#" and self.tiles[x, prev_y+1].char == "#":
-                        self.tiles[x, prev_y] = copy.deepcopy(tunnel)"""
-                        
-                for y in range(min(prev_y, curr_y), max(prev_y, curr_y) + 1):
-                    self.tiles[curr_x, y] = copy.deepcopy(floor)
-                    """if self.tiles[curr_x+1, y].char == "#" and self.tiles[curr_x-1, y].char == "#":
-                        self.tiles[curr_x, y] = copy.deepcopy(tunnel)"""
+            # We give the tunnel a 50% chance to start horizontally. Each leg is set as one slice of cells.
+            if self.random.randint(0,1) == 1:
+                self.set_terrain((slice(min(prev_x, curr_x), max(prev_x, curr_x) + 1), prev_y), floor)
+                self.set_terrain((curr_x, slice(min(prev_y, curr_y), max(prev_y, curr_y) + 1)), floor)
                     
             else:
-                for y in range(min(prev_y, curr_y), max(prev_y, curr_y) + 1):
-                    self.tiles[prev_x, y] = copy.deepcopy(floor)
-                    """if self.tiles[prev_x+1, y].char == "#" and self.tiles[prev_x-1, y].char == "#":
-                        self.tiles[prev_x, y] = copy.deepcopy(tunnel)"""
-                    
-                for x in range(min(prev_x, curr_x), max(prev_x, curr_x) + 1):
-                    self.tiles[x, curr_y] = copy.deepcopy(floor)
-                    """if self.tiles[x, curr_y+1].char == "#" and self.tiles[x, curr_y-1].char == "#":
-                        self.tiles[x, curr_y] = copy.deepcopy(tunnel)"""
+                self.set_terrain((prev_x, slice(min(prev_y, curr_y), max(prev_y, curr_y) + 1)), floor)
+                self.set_terrain((slice(min(prev_x, curr_x), max(prev_x, curr_x) + 1), curr_y), floor)
     
     def carve(self, min_rooms: int, max_rooms: int, min_room_size: int, max_room_size: int,  num_enemies: int, num_potions: int) -> None:
         """
         Carves out rooms in the dungeon according to parameters set by the engine (scales for difficulty).
+        Each room tries a few random spots, then is placed from the spots still free, so carving takes bounded time
+        however full the map is, and only draws from the level's random generator so the same seed carves the same rooms.
 
         Args:
             min_rooms (int): Minimum rooms to generate.
@@ -99,35 +304,38 @@ class Level:
 
         self.rooms = []
         rooms_so_far = 0
+        
+        # Cells taken by rooms, walls included, so a new room is checked against the cells it covers instead of every room so far.
+        taken = np.zeros((self.width, self.height), dtype=bool)
 
-        num_rooms = random.randint(min_rooms, max_rooms)
-        random.seed(self.seed + self.seedings)
-        self.seedings += 1
+        num_rooms = self.random.randint(min_rooms, max_rooms)
 
         while len(self.rooms) < min_rooms:
             
-            width = random.randint(min_room_size, max_room_size)
-            random.seed(self.seed + self.seedings)
-            self.seedings += 1
-            
-            height = random.randint(min_room_size, max_room_size)
-            random.seed(int(self.seed + self.seedings))
-            self.seedings -= 1
-            
-            x1 = random.randint(0, self.width - width - 1)
-            random.seed(self.seed + self.seedings)
-            self.seedings += 1
-            
-            y1 = random.randint(0, self.height - height - 1)
-            random.seed(int(self.seed + self.seedings))
-            self.seedings += 1
-            
-            room = RectangleRoom(x1, y1, width, height)
-
-            if any(room.intersect(checked_room) for checked_room in self.rooms):
-                continue
+            for attempt in range(placement_attempts):
+                width = self.random.randint(min_room_size, max_room_size)
+                height = self.random.randint(min_room_size, max_room_size)
+                x1 = self.random.randint(0, self.width - width - 1)
+                y1 = self.random.randint(0, self.height - height - 1)
+                
+                room = RectangleRoom(x1, y1, width, height)
+                if not taken[room.bounds].any():
+                    break
+            else:
+                # Once random spots keep missing, the room goes in a random free spot instead, at the smallest size
+                # if it doesn't fit anywhere, and carving stops when not even that fits.
+                room = None
+                for width, height in ((width, height), (min_room_size, min_room_size)):
+                    corners = get_free_corners(taken, width, height)
+                    if len(corners):
+                        x1, y1 = corners[self.random.randrange(len(corners))].tolist()
+                        room = RectangleRoom(x1, y1, width, height)
+                        break
+                if room is None:
+                    break
 
-            self.tiles[room.space] = copy.deepcopy(floor)
+            taken[room.bounds] = True
+            self.set_terrain(room.space, floor)
             
             self.tunnel(currRoom=room)
 
@@ -140,71 +348,74 @@ class Level:
     
     def spawner(self, num_enemies: int, num_potions: int) -> None:
         """
-        Spawns player, enemies, and potions into the map.
+        Spawns player, enemies, and potions into the map. Each entity tries a few random spots in the rooms, then is
+        placed from the free floor left in them, and no more enemies and potions are spawned than there is floor
+        for, so a crowded or small level still spawns in bounded time.
 
         Args:
             num_enemies (int): Number of enemies to spawn.
             num_potions (int): Number of potions to spawn.
         """
-        
+        in_rooms = np.zeros((self.width, self.height), dtype=bool)
+        for room in self.rooms:
+            in_rooms[room.space] = True
         
         # Spawns player in first room.
         first_room = self.rooms[0]
-        self.tiles[first_room.center] = self.player
-        player_x, player_y = first_room.center
-        self.player.set_pos(player_x, player_y)
+        self.place(self.player, first_room.center)
         
-        # Spawns exit in last room.
+        # Spawns exit in last room, as far from the player as the room allows when the player is in it too.
         last_room = self.rooms[len(self.rooms)-1]
-        self.tiles[last_room.center] = copy.deepcopy(exit)
+        exit_location = last_room.center
+        if exit_location == self.player.pos:
+            free = np.argwhere(self.glyphs[last_room.space] == floor.code) + (last_room.space[0].start, last_room.space[1].start)
+            exit_location = tuple(max(free.tolist(), key=lambda pos: abs(pos[0] - self.player.x) + abs(pos[1] - self.player.y)))
+        self.place(copy.copy(exit), exit_location)
+        
+        free_cells = int(np.count_nonzero(in_rooms & (self.glyphs == floor.code)))
+        num_enemies = min(num_enemies, free_cells)
+        num_potions = min(num_potions, free_cells - num_enemies)
         
         # Spawns all potions and enemies on map.
+        attempts = 0
         while num_enemies > 0 or num_potions > 0:
-            room_number = random.randint(0, len(self.rooms)-1)
-            random.seed(self.seed + self.seedings)
-            self.seedings += 1
-            
-            room = self.rooms[room_number]
-            
-            # We get the room's x and y limits, and pick a random spot in the room to spawn it in.
-            room_start_x = room.space[0].start
-            room_start_y = room.space[1].start
-            room_end_x = room.space[0].stop
-            room_end_y = room.space[1].stop
-            
-            spawn_location_x = random.randint(room_start_x, room_end_x-1)
-            random.seed(self.seed + self.seedings)
-            self.seedings += 1
-            
-            spawn_location_y = random.randint(room_start_y, room_end_y-1)
-            random.seed(self.seed + self.seedings)
-            self.seedings += 1
-            
-            
-            # If a spawned entity exists already, continue.
-            if self.tiles[spawn_location_x, spawn_location_y].char != ".":
-                continue
+            if attempts < placement_attempts:
+                attempts += 1
+                room_number = self.random.randint(0, len(self.rooms)-1)
+                
+                room = self.rooms[room_number]
+                
+                # We get the room's x and y limits, and pick a random spot in the room to spawn it in.
+                room_start_x = room.space[0].start
+                room_start_y = room.space[1].start
+                room_end_x = room.space[0].stop
+                room_end_y = room.space[1].stop
+                
+                spawn_location_x = self.random.randint(room_start_x, room_end_x-1)
+                spawn_location_y = self.random.randint(room_start_y, room_end_y-1)
+                
+                # If a spawned entity exists already, continue.
+                if self.glyphs[spawn_location_x, spawn_location_y] != floor.code:
+                    continue
+            else:
+                # Once random spots keep missing, the entity goes on a random free floor cell of the rooms instead.
+                free = np.argwhere(in_rooms & (self.glyphs == floor.code))
+                spawn_location_x, spawn_location_y = free[self.random.randrange(len(free))].tolist()
+            attempts = 0
             
             if num_enemies > 0:
                 
-                if random.randint(0,2) == 0:
-                    enemy = copy.deepcopy(vampire)
+                if self.random.randint(0,2) == 0:
+                    enemy = copy.copy(vampire)
                 else:
-                    enemy = copy.deepcopy(zombie)
+                    enemy = copy.copy(zombie)
                 
-                enemy.set_pos(spawn_location_x, spawn_location_y)
-                self.entities.add(enemy)
-                self.tiles[spawn_location_x, spawn_location_y] = enemy
+                self.place(enemy, (spawn_location_x, spawn_location_y))
                 num_enemies -= 1
                 
             elif num_potions > 0:
                 
-                potion = copy.deepcopy(health_potion)
-                potion.set_pos(spawn_location_x, spawn_location_y)
-                self.entities.add(potion)
-                self.tiles[spawn_location_x, spawn_location_y] = potion
+                potion = copy.copy(health_potion)
+                self.place(potion, (spawn_location_x, spawn_location_y))
                 num_potions -= 1
-            
-            # Accounts for two randomisations above
-            random.seed(self.seed + self.seedings)
-            self.seedings += 1
\ No newline at end of file
+            
\ No newline at end of file
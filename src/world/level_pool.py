@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import copy
+import numpy as np
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.pool import AsyncResult
+from typing import Deque, Dict, Optional, Tuple
+
+from src.engine import generate_level
+from src.entities.entity_factory import player
+from src.world.level import Level
+
+def generate(depth: int, seed: Optional[int], map_size: Tuple[int, int]) -> Level:
+    """
+    Generates a level in a worker process, with a stand in player that the game swaps for its own.
+
+    Args:
+        depth (int): Depth of the level.
+        seed (Optional[int]): Seed of the game the level belongs to, or None for a random one.
+        map_size (Tuple[int, int]): Height and width of the level.
+
+    Returns:
+        Level: The generated level.
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    return generate_level(depth, copy.deepcopy(player), seed, map_size)
+
+class LevelPool:
+
+    def __init__(self, num_workers: int = 2, ahead: int = 2, start_method: Optional[str] = None) -> None:
+        """
+        Level pool generates levels ahead of demand in background worker processes, so that resets and exits
+        take a ready level instead of generating one on the spot. Only levels already done are taken; when none is,
+        the level is generated on the spot as it would be without a pool, so a reset never waits on a worker.
+        Taking a level costs about a third of generating one, and the workers need cores of their own, so the pool
+        only pays off for large levels with cores to spare. At the default map size a level takes under a millisecond
+        to generate, and launch.py and main.py leave the pool off unless pool workers are asked for.
+        Levels are kept by depth, seed and map size. With a fixed seed the same levels are asked for after every reset,
+        so each level handed out is generated again along with the level after it, until the game releases the seed.
+        Without one, any level of the right depth will do, so a few random levels are kept ready for the depth asked
+        for and the next.
+
+        Args:
+            num_workers (int, optional): Number of worker processes generating levels. Defaults to 2.
+            ahead (int, optional): Number of levels to keep ready for each depth and seed. Defaults to 2.
+            start_method (Optional[str], optional): Multiprocessing start method. Defaults to forkserver where available, otherwise spawn.
+        """
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        self.pool = mp.get_context(start_method).Pool(num_workers)
+        self.ahead = ahead
+        self.pending: Dict[Tuple[int, Optional[int], Tuple[int, int]], Deque[AsyncResult]] = {}
+
+    def fill(self, depth: int, seed: Optional[int], map_size: Tuple[int, int]) -> None:
+        """
+        Starts generating levels for a depth, seed and map size until enough are ready or on their way.
+        """
+        pending = self.pending.setdefault((depth, seed, map_size), deque())
+        while len(pending) < self.ahead:
+            pending.append(self.pool.apply_async(generate, (depth, seed, map_size)))
+
+    def get(self, depth: int, seed: Optional[int] = None, map_size: Tuple[int, int] = (15, 18)) -> Level:
+        """
+        Takes a level out of the pool if one is ready, generating it here otherwise, and refills the pool.
+
+        Args:
+            depth (int): Depth of the level.
+            seed (Optional[int], optional): Seed of the game, or None for any level of that depth. Defaults to None.
+            map_size (Tuple[int, int], optional): Height and width of the level. Defaults to (15, 18).
+
+        Returns:
+            Level: The level, still holding the stand in player.
+        """
+        map_size = tuple(map_size)
+        pending = self.pending.setdefault((depth, seed, map_size), deque())
+        for result in pending:
+            if result.ready():
+                pending.remove(result)
+                level = result.get()
+                break
+        else:
+            level = generate(depth, seed, map_size)
+
+        self.fill(depth, seed, map_size)
+        self.fill(depth + 1, seed, map_size)
+        return level
+
+    def release(self, seed: int) -> None:
+        """
+        Forgets the levels kept for a fixed seed that won't be asked for again, like once a game moves on to another seed,
+        so the pool doesn't keep levels for every seed it has seen. Levels already being generated can't be stopped
+        in the worker processes, but they are dropped as soon as they are done.
+
+        Args:
+            seed (int): Seed of the game the levels belong to.
+        """
+        for key in [key for key in self.pending if key[1] == seed]:
+            del self.pending[key]
+
+    def close(self) -> None:
+        """
+        Stops the worker processes.
+        """
+        self.pool.terminate()
+        self.pool.join()
@@ -29,6 +29,17 @@ class RectangleRoom:
         """
         return slice(self.x1 + 1, self.x2), slice(self.y1 + 1, self.y2)
     
+    @property
+    def bounds(self) -> Tuple[slice, slice]:
+        """
+        Calculates slices for getting the whole room from the map, walls included.
+        Two rooms intersect exactly when their bounds share a cell.
+
+        Returns:
+            Tuple[slice, slice]: A tuple of slices for the x and y coordinates.
+        """
+        return slice(self.x1, self.x2 + 1), slice(self.y1, self.y2 + 1)
+    
     @property
     def center(self) -> Tuple[int, int]:
         """
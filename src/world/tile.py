@@ -1,43 +1,58 @@
+# Every character the game can draw. A glyph's code is its index in this string,
+# and codes are what the level stores in its arrays instead of Tile objects.
+glyphs = "#.-q@zv+> "
+glyph_codes = {char: code for code, char in enumerate(glyphs)}
+
 class Tile:
 
-    def __init__(self, blocks_movement: bool, see_through: bool, char: str, dark: str, explored: bool, already_explored: bool = False) -> None:
+    def __init__(self, blocks_movement: bool, see_through: bool, char: str, dark: str) -> None:
         """
         Tile class for walls and floors. Could be extendable to other types too.
+        Tiles are only templates, per cell state like exploration is kept in the level's arrays.
 
         Args:
             blocks_movement (bool): If tile blocks movement for entities.
             see_through (bool): If entities can see through the tile.
             char (str): How it is rendered in default view
             dark (str): [In-Progress] To be used to rendering a different view.
-            explored (bool): If tile is explored by player.
         """
         self.dark = dark
         self.char = char
         self.see_through = see_through
         self.blocks_movement = blocks_movement
-        self.explored = explored
-        self.already_explored = already_explored
+
+    @property
+    def code(self) -> int:
+        return glyph_codes[self.char]
 
 floor = Tile(
     blocks_movement=False,
     see_through=True,
     dark="▩",
-    char=".",
-    explored=False
+    char="."
 )
 
 wall = Tile(
     blocks_movement=True,
     see_through=False,
     dark="■",
-    char="#",
-    explored=False,
+    char="#"
 )
 
 tunnel = Tile(
     blocks_movement=False,
     see_through=True,
     dark="▩",
-    char="-",
-    explored=False
+    char="-"
+)
+
+# Left behind when an actor dies.
+corpse = Tile(
+    blocks_movement=False,
+    see_through=True,
+    dark="▩",
+    char="q"
 )
+
+# Looks up the tile template from a terrain code.
+tile_types = {tile.code: tile for tile in (wall, floor, tunnel, corpse)}